@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# Benchmarks for gofish2: parsing speed and memory per node. Run with:  python bench_gofish2.py [file.sgf ...]
+#
+# Without arguments, a synthetic corpus is generated (the same one every time).
+
+import gc, random, sys, time, tracemalloc
+
+import gofish2
+
+# -------------------------------------------------------------------------------------------------
+
+def synthetic_corpus(games = 200, moves = 250, seed = 1):
+
+	# Plausible-looking games: a header, a mainline of moves, an occasional comment and a few
+	# short variations.
+
+	rng = random.Random(seed)
+	letters = "abcdefghijklmnopqrs"
+	out = []
+
+	for g in range(games):
+		out.append("(;GM[1]FF[4]SZ[19]KM[6.5]PB[Black {}]PW[White {}]RE[B+R]".format(g, g))
+		for i in range(moves):
+			out.append(";{}[{}{}]".format("BW"[i % 2], rng.choice(letters), rng.choice(letters)))
+			if rng.random() < 0.05:
+				out.append("C[move {} looked {}]".format(i + 1, rng.choice(["fine", "slow", "dubious", "excellent"])))
+			if rng.random() < 0.01:
+				out.append("(;{}[{}{}]C[variation])".format("WB"[i % 2], rng.choice(letters), rng.choice(letters)))
+		out.append(")\n")
+
+	return "".join(out).encode()
+
+
+def count_nodes(roots):
+
+	nodes = 0
+	values = 0
+	todo = list(roots)
+
+	while todo:
+		node = todo.pop()
+		todo.extend(node.children)
+		nodes += 1
+		values += sum(len(node.all_values(key)) for key in node.props)
+
+	return nodes, values
+
+# -------------------------------------------------------------------------------------------------
+# The baseline for the memory benchmark: Node as it was before slots and single-value props, with a
+# __dict__, and every value in a list of its own, decoded into a new string as the old parser did.
+
+class _DictNode:
+
+	def __init__(self, parent = None):
+
+		self.parent = parent
+		self.children = []
+		self.props = dict()
+		self._board = None
+
+		if parent:
+			parent.children.append(self)
+
+
+def _dict_nodes(roots):
+
+	ret = []
+	todo = [(root, None) for root in reversed(roots)]
+
+	while todo:
+		node, parent = todo.pop()
+		copy = _DictNode(parent)
+		for key in node.props:
+			copy.props[key.encode().decode()] = [value.encode().decode() for value in node.all_values(key)]
+		if parent is None:
+			ret.append(copy)
+		todo.extend((child, copy) for child in reversed(node.children))
+
+	return ret
+
+# -------------------------------------------------------------------------------------------------
+
+def bench_parse_throughput(name, buf, repeats = 5):
+
+	# Parsing speed of load_sgf(), in MB of SGF per second, taking the best of a few runs.
+
+	best = None
+
+	for n in range(repeats):
+		start = time.perf_counter()
+		gofish2.load_sgf(buf)
+		elapsed = time.perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+
+	print("{:<24} {:>9.2f} MB {:>9.3f} s {:>8.1f} MB/s".format(name, len(buf) / 1e6, best, len(buf) / 1e6 / best))
+
+
+def _traced(f, *args):
+
+	# Returns what f() returns, and the memory it still holds afterwards, as seen by tracemalloc.
+
+	gc.collect()
+	tracemalloc.start()
+	ret = f(*args)
+	gc.collect()
+	used = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+
+	return ret, used
+
+
+def bench_node_memory(name, buf):
+
+	# Memory held by the loaded trees, per node, against the same trees as _DictNodes.
+
+	roots, used = _traced(gofish2.load_sgf, buf)
+	baseline = _traced(_dict_nodes, roots)[1]
+
+	nodes, values = count_nodes(roots)
+	print("{:<24} {:>9} nodes {:>9} values {:>8.1f} bytes/node (baseline {:.1f}, {:.0%})".format(
+		name, nodes, values, used / nodes, baseline / nodes, used / baseline))
+
+
+def main():
+
+	if len(sys.argv) > 1:
+		corpus = []
+		for filename in sys.argv[1:]:
+			with open(filename, "rb") as infile:
+				corpus.append((filename, infile.read()))
+	else:
+		corpus = [("synthetic corpus", synthetic_corpus())]
+
+	for name, buf in corpus:
+		bench_parse_throughput(name, buf)
+	for name, buf in corpus:
+		bench_node_memory(name, buf)
+
+
+if __name__ == "__main__":
+	main()
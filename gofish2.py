@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 
+import bz2, concurrent.futures, gc, gzip, heapq, io, lzma, mmap, os, random, re, sqlite3, struct, sys, tarfile, tempfile, weakref, zipfile, zlib
+from array import array
+from collections import OrderedDict
+
 class ParserFail(Exception):
 	pass
 
@@ -13,979 +17,4188 @@ class ParseResult:
 
 # -------------------------------------------------------------------------------------------------
 
-class Board:
+# Board contents are stored as one byte per point in a padded 1-D buffer, using these codes.
 
-	def __init__(self, width, height, state = None, ko = None, active = "b", caps_by_b = 0, caps_by_w = 0):
+_EMPTY = 0
+_BLACK = 1
+_WHITE = 2
+_EDGE = 3
 
-		self.width = width
-		self.height = height
-		self.state = []
-		self.ko = ko
-		self.active = active
-		self.caps_by_b = caps_by_b
-		self.caps_by_w = caps_by_w
+_colour_codes = {"": _EMPTY, "b": _BLACK, "w": _WHITE}
+_colour_strings = ("", "b", "w", "")
 
-		for x in range(width):
-			self.state.append([])
-			for y in range(height):
-				if state:
-					self.state[x].append(state[x][y])
-				else:
-					self.state[x].append("")
+_empty_bytes = bytes([1]) + bytes(255)					# Translation table: EMPTY --> 1, else 0
+_legal_point = re.compile(b"\x01")
 
+# Zobrist keys, indexed by x + y * 52 so that a point has the same keys on every board size. The
+# seed is fixed so hashes are stable between runs (and can therefore be stored).
 
-	def __eq__(self, other):
-		if self.width != other.width or self.height != other.height:
-			return False
-		if self.ko != other.ko or self.active != other.active:
-			return False
-		if self.caps_by_b != other.caps_by_b or self.caps_by_w != other.caps_by_w:
-			return False
-		for x in range(self.width):
-			for y in range(self.height):
-				if self.state[x][y] != other.state[x][y]:
-					return False
-		return True
+_zobrist_rng = random.Random(0x60F15E)
+_zobrist_black = [_zobrist_rng.getrandbits(64) for i in range(52 * 52)]
+_zobrist_white = [_zobrist_rng.getrandbits(64) for i in range(52 * 52)]
+_zobrist_ko = [_zobrist_rng.getrandbits(64) for i in range(52 * 52)]
+_zobrist_white_to_play = _zobrist_rng.getrandbits(64)
+_zobrist_size = [_zobrist_rng.getrandbits(64) for i in range(53 * 53)]		# Indexed by width + height * 53
 
 
-	def copy(self):
-		return Board(self.width, self.height, self.state, self.ko, self.active, self.caps_by_b, self.caps_by_w)
+class _Geometry:
 
+	# Each row of the buffer has one EDGE byte on its left (which is also the right edge of the
+	# previous row) and there are whole EDGE rows above and below the board. Thus the neighbours
+	# of any on-board point p are simply p + 1, p - 1, p + stride, p - stride.
 
-	def dump(self):
+	def __init__(self, width, height):
 
-		if self.ko:
-			ko_x, ko_y = s_to_xy(self.ko)
-		else:
-			ko_x, ko_y = None, None
+		self.width = width
+		self.height = height
 
-		for y in range(0, self.height):
-			for x in range(0, self.width):
-				char = "X" if self.state[x][y] == "b" else "O" if self.state[x][y] == "w" else " " if (ko_x == x and ko_y == y) else "."
-				print(char, end = " ")
-			print()
+		w = max(width, 0)
+		h = max(height, 0)
 
-		print("Captures: {} by Black - {} by White".format(self.caps_by_b, self.caps_by_w))
-		print("Next to play: {}".format("Black" if self.active == "b" else "White"))
+		self.stride = w + 1
+		self.size = (h + 2) * self.stride
+		self.points = []						# In x-major order, like the old state[x][y] lists.
+		self.s_to_p = dict()
+		self.p_to_s = [None] * self.size
 
+		# zobrist[colour][p] is the key for a stone of that colour at p (0 for empty and edges)...
 
-	def state_at(self, s):
+		self.zobrist = ([0] * self.size, [0] * self.size, [0] * self.size)
+		self.zobrist_ko = [0] * self.size
+		self.zobrist_size = _zobrist_size[min(w, 52) + min(h, 52) * 53]		# For telling sizes apart
 
-		x, y = s_to_xy(s)
+		template = bytearray([_EDGE]) * self.size
 
-		if x < 0 or x >= self.width or y < 0 or y >= self.height:
-			raise ValueError		# s was out of bounds
+		for x in range(w):
+			for y in range(h):
+				p = (y + 1) * self.stride + x + 1
+				template[p] = _EMPTY
+				self.points.append(p)
+				if x < 52 and y < 52:
+					s = xy_to_s(x, y)
+					self.s_to_p[s] = p
+					self.p_to_s[p] = s
+					self.zobrist[_BLACK][p] = _zobrist_black[x + y * 52]
+					self.zobrist[_WHITE][p] = _zobrist_white[x + y * 52]
+					self.zobrist_ko[p] = _zobrist_ko[x + y * 52]
 
-		return self.state[x][y]
+		self.template = bytes(template)
+		self.zeros = bytes(2 * self.size)		# For initialising the array("h") chain tables.
 
+		# Neighbours of each on-board point, in the order right, left, down, up...
 
-	def set_at(self, s, colour):
+		self.neighbour_points = [None] * self.size
+		self.neighbour_strings = [None] * self.size
 
-		if colour not in ["", "b", "w"]:
-			raise ValueError
+		for p in self.points:
+			neighbours = tuple(n for n in (p + 1, p - 1, p + self.stride, p - self.stride) if template[n] != _EDGE)
+			self.neighbour_points[p] = neighbours
+			if self.p_to_s[p]:
+				self.neighbour_strings[p] = tuple(self.p_to_s[n] for n in neighbours if self.p_to_s[n])
 
-		x, y = s_to_xy(s)
 
-		if x < 0 or x >= self.width or y < 0 or y >= self.height:
-			raise ValueError		# s was out of bounds
+_geometries = dict()
 
-		self.state[x][y] = colour
+def _geometry(width, height):
 
+	geo = _geometries.get((width, height))
+	if not geo:
+		geo = _Geometry(width, height)
+		_geometries[(width, height)] = geo
+	return geo
 
-	def neighbours(self, s):
 
-		x, y = s_to_xy(s)
+# For each symmetry of a board size (8 if square, else 4) a tuple of key lists indexed by colour then
+# point, giving the Zobrist key of a stone at that point's image. The identity comes first, so its
+# keys are those of _Geometry.zobrist.
 
-		if x < 0 or x >= self.width or y < 0 or y >= self.height:
-			raise ValueError		# s was out of bounds
+_symmetry_tables = dict()
 
-		ret = []
-		if x < self.width - 1:
-			ret.append(xy_to_s(x + 1, y))
-		if x > 0:
-			ret.append(xy_to_s(x - 1, y))
-		if y < self.height - 1:
-			ret.append(xy_to_s(x, y + 1))
-		if y > 0:
-			ret.append(xy_to_s(x, y - 1))
-		return ret
+def _symmetries(width, height):
 
+	tables = _symmetry_tables.get((width, height))
+	if tables:
+		return tables
 
-	def has_liberties(self, s):
+	geo = _geometry(width, height)
+	w = max(width, 0)
+	h = max(height, 0)
 
-		if not self.state_at(s):
-			return False
+	transforms = [
+		lambda x, y: (x, y),
+		lambda x, y: (w - 1 - x, y),
+		lambda x, y: (x, h - 1 - y),
+		lambda x, y: (w - 1 - x, h - 1 - y),
+	]
+	if w == h:
+		transforms += [
+			lambda x, y: (y, x),
+			lambda x, y: (h - 1 - y, x),
+			lambda x, y: (y, w - 1 - x),
+			lambda x, y: (h - 1 - y, w - 1 - x),
+		]
 
-		return self._has_liberties_bfs(s)
+	tables = []
+	for f in transforms:
+		black = [0] * geo.size
+		white = [0] * geo.size
+		for p in geo.points:
+			x, y = f(p % geo.stride - 1, p // geo.stride - 1)
+			if x < 52 and y < 52:
+				black[p] = _zobrist_black[x + y * 52]
+				white[p] = _zobrist_white[x + y * 52]
+		tables.append(([0] * geo.size, black, white))
 
+	_symmetry_tables[(width, height)] = tables
+	return tables
 
-	def _has_liberties_bfs(self, s, touched = None):
+class _StateView:
 
-		colour = self.state_at(s)
+	# Board.state; see there. Made once per board. Indexing with x gives a _StateColumn, which
+	# indexing with y reads from the buffer.
 
-		todo = [s]
+	__slots__ = ("_columns",)
 
-		if touched == None:
-			touched = set()
-		touched.add(s)
+	def __init__(self, board):
+		self._columns = [_StateColumn(board, x) for x in range(board.width)]
 
-		for p in todo:		# Note: it's safe to iterate over a list that's getting appends like this is.
-			for neighbour in self.neighbours(p):
-				if neighbour not in touched:
-					neighbour_colour = self.state_at(neighbour)
-					if neighbour_colour == "":
-						return True
-					elif neighbour_colour == colour:
-						todo.append(neighbour)
-						touched.add(neighbour)
+	def __len__(self):
+		return len(self._columns)
 
-		return False
+	def __getitem__(self, x):
+		return self._columns[x]
 
+	def __iter__(self):
+		return iter(self._columns)
 
-	def destroy_group(self, s):
+	def __eq__(self, other):
+		if not isinstance(other, (list, tuple, _StateView)):
+			return NotImplemented
+		return [list(column) for column in self] == [list(column) for column in other]
 
-		colour = self.state_at(s)
-		if not colour:
-			return 0
+	def __repr__(self):
+		return repr([list(column) for column in self])
 
-		todo = [s]
-		self.set_at(s, "")
 
-		for p in todo:		# Note: it's safe to iterate over a list that's getting appends like this is.
-			for neighbour in self.neighbours(p):
-				if self.state_at(neighbour) == colour:
-					todo.append(neighbour)
-					self.set_at(neighbour, "")
+class _StateColumn:
 
-		if colour == "b":
-			self.caps_by_w += len(todo)
-		else:
-			self.caps_by_b += len(todo)
+	__slots__ = ("_board", "_buf", "_points")
 
-		return len(todo)
+	def __init__(self, board, x):
+		self._board = board
+		self._buf = board._buf
+		self._points = tuple(board.xy_to_point(x, y) for y in range(board.height))
 
+	def __len__(self):
+		return len(self._points)
 
-	def legal_move(self, s):
-		return self.legal_move_colour(s, self.active)
+	def __getitem__(self, y):
+		if type(y) is slice:
+			return [_colour_strings[self._buf[p]] for p in self._points[y]]
+		return _colour_strings[self._buf[self._points[y]]]
 
+	def __setitem__(self, y, colour):
+		self._board.set_at_point(self._points[y], colour)
 
-	def legal_move_colour(self, s, colour):		# Note: does not consider passes as "legal moves".
+	def __iter__(self):
+		buf = self._buf
+		for p in self._points:
+			yield _colour_strings[buf[p]]
 
-		assert(colour == "b" or colour == "w")
+	def __eq__(self, other):
+		if not isinstance(other, (list, tuple, _StateColumn)):
+			return NotImplemented
+		return list(self) == list(other)
 
-		try:
-			x, y = s_to_xy(s)
-		except:
-			return False						# s_to_xy() can throw for many reasons, but this function has to be more tolerant.
+	def __repr__(self):
+		return repr(list(self))
 
-		if x < 0 or x >= self.width or y < 0 or y >= self.height:
-			return False
-		if self.state_at(s):
-			return False
-		if self.ko == s:
-			return False
+# -------------------------------------------------------------------------------------------------
 
-		# Move will be legal as long as it's not suicide...
+class Board:
 
-		neighbours = self.neighbours(s)
+	def __init__(self, width, height, state = None, ko = None, active = "b", caps_by_b = 0, caps_by_w = 0):
 
-		for neighbour in neighbours:
-			if not self.state_at(neighbour):
-				return True						# New stone has a liberty.
+		self.width = width
+		self.height = height
+		self.ko = ko
+		self.active = active
+		self.caps_by_b = caps_by_b
+		self.caps_by_w = caps_by_w
 
-		opposite_colour = "b" if colour == "w" else "w"
+		self._geo = _geometry(width, height)
+		self._buf = bytearray(self._geo.template)
+		self._hash = 0							# Zobrist hash of the stones only; see __hash__().
 
-		for neighbour in neighbours:
-			if self.state_at(neighbour) == colour:
-				touched = set()
-				touched.add(s)
-				if self._has_liberties_bfs(neighbour, touched):
-					return True					# One of the groups we're joining has a liberty other than s.
-			elif self.state_at(neighbour) == opposite_colour:
-				touched = set()
-				touched.add(s)
-				if not self._has_liberties_bfs(neighbour, touched):
-					return True					# One of the enemy groups has no liberties other than s.
+		# Chains (groups) are tracked incrementally once built, in arrays indexed by point:
+		#
+		#   _chain[p]   the "head" point of the chain holding the stone at p, or 0
+		#   _next[p]    the next stone of that chain (the stones form a circular list)
+		#   _size[h]    the number of stones in the chain with head h
+		#   _nlibs[h]   the number of liberties of the chain with head h
+		#
+		# None means they have not been built; this is done lazily by _ensure_chains().
 
-		return False
+		self._chain = None
+		self._next = None
+		self._size = None
+		self._nlibs = None
 
+		# When not None, every change to a point appends (p, old colour) here, flattened.
 
-	def play_move_or_pass(self, s, colour):
+		self._journal = None
 
-		assert(colour == "b" or colour == "w")
+		# When legal moves are being tracked (see track_legal_moves()), _legal[c] is a bytearray over
+		# the buffer, 1 where a move by colour c is legal, or None if it needs a full rebuild. Points
+		# changed since the masks were last brought up to date are appended to _touched.
 
-		self.ko = None
-		self.active = "b" if colour == "w" else "w"
+		self._legal = None
+		self._legal_ko = None
+		self._touched = None
 
-		try:
-			x, y = s_to_xy(s)
-		except:
-			return					# s was invalid in some way; treat as a pass.
+		# Undo stack and chain log for push() and pop(); see push().
 
-		if x < 0 or x >= self.width or y < 0 or y >= self.height:
-			return					# Treat as a pass.
+		self._undo = None
+		self._chain_log = None
 
-		self.set_at(s, colour)
-		caps = 0
+		self._state = None						# The view returned by the state property, once made.
 
-		for neighbour in self.neighbours(s):
+		if state:
+			for x in range(width):
+				for y in range(height):
+					p = self.xy_to_point(x, y)
+					c = _colour_codes[state[x][y]]
+					self._buf[p] = c
+					self._hash ^= self._geo.zobrist[c][p]
 
-			neighbour_colour = self.state_at(neighbour)
 
-			if neighbour_colour and neighbour_colour != colour:
-				if not self.has_liberties(neighbour):
-					caps += self.destroy_group(neighbour)
+	def __eq__(self, other):
+		if self.width != other.width or self.height != other.height:
+			return False
+		if self.ko != other.ko or self.active != other.active:
+			return False
+		if self.caps_by_b != other.caps_by_b or self.caps_by_w != other.caps_by_w:
+			return False
+		if self._hash != other._hash:
+			return False
+		return self._buf == other._buf
 
-		if not self.has_liberties(s):
-			self.destroy_group(s)
 
-		if caps == 1:
-			if self._one_liberty_singleton(s):
-				self.ko = self._ko_square_finder(s)
+	def __hash__(self):
 
+		# Covers the stones, ko and side to move (but not captures, so equal hashes don't imply
+		# __eq__, though of course the reverse holds). Note that Boards are mutable; don't change one
+		# while it's being used as a dict key or set member.
 
-	def _one_liberty_singleton(self, s):
+		h = self._hash
 
-		colour = self.state_at(s)
+		if self.ko:
+			p = self._geo.s_to_p.get(self.ko)
+			if p:
+				h ^= self._geo.zobrist_ko[p]
 
-		if not colour:
-			return False
+		if self.active == "w":
+			h ^= _zobrist_white_to_play
 
-		liberties = 0
+		return h
 
-		for neighbour in self.neighbours(s):
-			neighbour_colour = self.state_at(neighbour)
-			if neighbour_colour == colour:
-				return False
-			if not neighbour_colour:
-				liberties += 1
 
-		return liberties == 1
+	def position_hash(self):
 
+		# Zobrist hash of the stones only, i.e. what positional superko compares.
 
-	def _ko_square_finder(self, s):
+		return self._hash
 
-		for neighbour in self.neighbours(s):
-			if not self.state_at(neighbour):
-				return neighbour
 
-		return None
+	def canonical_hash(self):
 
-# -------------------------------------------------------------------------------------------------
+		# As position_hash(), but the same for all rotations and reflections of the position, being
+		# the lowest of their hashes.
 
-class Node:
+		buf = self._buf
+		tables = _symmetries(self.width, self.height)
+		hashes = [0] * len(tables)
 
-	def __init__(self, parent = None):
+		for p in self._geo.points:
+			c = buf[p]
+			if c:
+				for i, keys in enumerate(tables):
+					hashes[i] ^= keys[c][p]
 
-		self.parent = parent
-		self.children = []
-		self.props = dict()
-		self._board = None
+		return min(hashes)
 
-		if parent:
-			parent.children.append(self)
 
+	def copy(self):
 
-	@property
-	def width(self):
+		# Bypasses __init__ since everything is simply copied over.
 
-		if self._board:
-			return self._board.width
+		ret = Board.__new__(Board)
 
-		root = self.get_root()
-		sz = root.get("SZ")
+		ret.width = self.width
+		ret.height = self.height
+		ret.ko = self.ko
+		ret.active = self.active
+		ret.caps_by_b = self.caps_by_b
+		ret.caps_by_w = self.caps_by_w
 
-		if sz == None:
-			return 19
+		ret._geo = self._geo
+		ret._buf = self._buf[:]
+		ret._hash = self._hash
+		ret._journal = None
 
-		if ":" in sz:
-			width_string = sz.split(":")[0]
+		if self._legal is not None:
+			ret._legal = [m and m[:] for m in self._legal]
+			ret._legal_ko = self._legal_ko
+			ret._touched = self._touched[:]
 		else:
-			width_string = sz
+			ret._legal = None
+			ret._legal_ko = None
+			ret._touched = None
+
+		ret._undo = None
+		ret._chain_log = None
+		ret._state = None
+
+		if self._chain is not None:
+			ret._chain = self._chain[:]
+			ret._next = self._next[:]
+			ret._size = self._size[:]
+			ret._nlibs = self._nlibs[:]
+		else:
+			ret._chain = None
+			ret._next = None
+			ret._size = None
+			ret._nlibs = None
 
-		try:
-			return min(int(width_string), 52)
-		except:
-			return 19
+		return ret
 
 
 	@property
-	def height(self):
+	def state(self):
 
-		if self._board:
-			return self._board.height
+		# The old list-of-columns representation, i.e. state[x][y] is "", "b" or "w". This is a view
+		# over the buffer, not a copy, so it's cheap to index and always current. As before, writing
+		# state[x][y] = colour is the same as set_at().
 
-		root = self.get_root()
-		sz = root.get("SZ")
+		if self._state is None:
+			self._state = _StateView(self)
+		return self._state
 
-		if sz == None:
-			return 19
 
-		if ":" in sz:
-			height_string = sz.split(":")[1]
-		else:
-			height_string = sz
+	@state.setter
+	def state(self, state):
 
-		try:
-			return min(int(height_string), 52)
-		except:
-			return 19
+		for x in range(self.width):
+			for y in range(self.height):
+				self.set_at_point(self.xy_to_point(x, y), state[x][y])
 
 
-	def apply(self, board):
+	def to_numpy(self):
 
-		for s in self.all_values("AE"):
-			if len(s) == 5:
-				for z in points_list(s):
-					try:
-						board.set_at(z, "")
-					except:
-						pass
-			else:
-				try:
-					board.set_at(s, "")
-				except:
-					pass
+		# A new uint8 array of shape (height, width), i.e. indexed [y][x], holding 0 for empty, 1 for
+		# black and 2 for white. Needs NumPy.
 
-		for s in self.all_values("AB"):
-			if len(s) == 5:
-				for z in points_list(s):
-					try:
-						board.set_at(z, "b")
-					except:
-						pass
-			else:
-				try:
-					board.set_at(s, "b")
-				except:
-					pass
-			# board.active = "w"				# We likely shouldn't do this.
+		return _numpy_view(self._buf, self._geo).copy()
 
-		for s in self.all_values("AW"):
-			if len(s) == 5:
-				for z in points_list(s):
-					try:
-						board.set_at(z, "w")
-					except:
-						pass
-			else:
-				try:
-					board.set_at(s, "w")
-				except:
-					pass
-			# board.active = "b"				# We likely shouldn't do this.
 
-		for s in self.all_values("B"):
-			board.play_move_or_pass(s, "b")		# Will treat s as a pass if it's not a valid move.
+	def dump(self):
 
-		for s in self.all_values("W"):
-			board.play_move_or_pass(s, "w")		# Will treat s as a pass if it's not a valid move.
+		ko_p = self._geo.s_to_p.get(self.ko) if self.ko else None
 
-		if not self.parent:
-			if self.has_key("AB") and not self.has_key("AW") and not self.has_key("B") and not self.has_key("W"):
-				board.active = "w"
+		for y in range(0, self.height):
+			for x in range(0, self.width):
+				p = self.xy_to_point(x, y)
+				c = self._buf[p]
+				char = "X" if c == _BLACK else "O" if c == _WHITE else " " if p == ko_p else "."
+				print(char, end = " ")
+			print()
 
-		pl = self.get("PL")
-		if pl == "B" or pl == "b":
-			board.active = "b"
-		if pl == "W" or pl == "w":
-			board.active = "w"
+		print("Captures: {} by Black - {} by White".format(self.caps_by_b, self.caps_by_w))
+		print("Next to play: {}".format("Black" if self.active == "b" else "White"))
 
+	# ---------------------------------------------------------------------------------------------
+	# Integer point API. A point is an index into the padded buffer; see _Geometry.
 
-	def _cache_board(self):
+	def point(self, s):							# "cc" --> integer point
 
-		# Also caches the entire history (not doing so is silly, I guess).
+		try:
+			return self._geo.s_to_p[s]
+		except KeyError:
+			s_to_xy(s)							# Raises TypeError or ValueError if s is malformed...
+			raise ValueError					# ...otherwise s was out of bounds.
 
-		if self._board:
-			return
 
-		node = self
-		history = []
-		work_board = None
+	def _point_or_none(self, s):				# Like point() but tolerant, for the move functions.
 
-		while node:
-			if node._board:
-				work_board = node._board.copy()
-				break
-			else:
-				history.append(node)
-				node = node.parent
+		try:
+			return self._geo.s_to_p.get(s)
+		except TypeError:
+			return None
 
-		history.reverse()
 
-		if not work_board:
-			work_board = Board(self.width, self.height)
+	def point_to_s(self, p):
 
-		for node in history:
-			node.apply(work_board)
-			node._board = work_board.copy()
+		self._check_point(p)
+		return self._geo.p_to_s[p] or ""		# Only "" for points beyond 52 on enormous boards.
 
 
-	def make_board(self):
+	def xy_to_point(self, x, y):
 
-		self._cache_board()
-		return self._board.copy()
+		if x < 0 or x >= self.width or y < 0 or y >= self.height:
+			raise ValueError
 
+		return (y + 1) * self._geo.stride + x + 1
 
-	def get_root(self):
 
-		node = self
-		while node.parent:
-			node = node.parent
-		return node
+	def point_to_xy(self, p):
 
+		self._check_point(p)
+		stride = self._geo.stride
+		return (p % stride - 1, p // stride - 1)
 
-	def get_end(self):
 
-		node = self
-		while len(node.children) > 0:
-			node = node.children[0]
-		return node
+	def points(self):							# All on-board points
+		return list(self._geo.points)
 
 
-	def history(self):
+	def _check_point(self, p):
 
-		node = self
-		ret = []
+		if p < 0 or p >= self._geo.size or self._buf[p] == _EDGE:
+			raise ValueError					# p was out of bounds
 
-		while node:
-			ret.append(node)
-			node = node.parent
 
-		ret.reverse()
-		return ret
+	def state_at_point(self, p):
 
+		self._check_point(p)
+		return _colour_strings[self._buf[p]]
 
-	def set(self, key, value):
 
-		key = str(key)
-		value = str(value)
-		self._mutor_check(key)
+	def set_at_point(self, p, colour):
 
-		self.props[key] = [value]
+		if colour not in ["", "b", "w"]:
+			raise ValueError
 
+		self._check_point(p)
+		self._set(p, _colour_codes[colour])
 
-	def get(self, key):
 
-		key = str(key)
+	def neighbour_points(self, p):
 
-		if key not in self.props:
-			return ""
-		return self.props[key][0]
+		self._check_point(p)
+		return list(self._geo.neighbour_points[p])
 
+	# ---------------------------------------------------------------------------------------------
+	# SGF-string API, on top of the above.
 
-	def has_key(self, key):
+	def state_at(self, s):
+		return _colour_strings[self._buf[self.point(s)]]
 
-		return str(key) in self.props
 
+	def set_at(self, s, colour):
 
-	def all_values(self, key):
+		if colour not in ["", "b", "w"]:
+			raise ValueError
 
-		key = str(key)
+		self._set(self.point(s), _colour_codes[colour])
 
-		ret = []
-		if key not in self.props:
-			return ret
-		for value in self.props[key]:
-			ret.append(value)
-		return ret
 
+	def _set(self, p, c):
 
-	def add_value(self, key, value):
+		if self._undo:
+			self._refuse_while_pushed()
 
-		key = str(key)
-		value = str(value)
-		self._mutor_check(key)
+		old = self._buf[p]
 
-		if key not in self.props:
-			self.props[key] = []
-		self.props[key].append(value)
+		if old == c:
+			return
 
+		self._buf[p] = c
+		self._hash ^= self._geo.zobrist[old][p] ^ self._geo.zobrist[c][p]
 
-	def add_value_fast(self, key, value):
+		if self._journal is not None:
+			self._journal += (p, old)
+		if self._touched is not None:
+			self._touched.append(p)
 
-		if key not in self.props:
-			self.props[key] = []
-		self.props[key].append(value)
+		if self._chain is not None:
+			self._refresh_chains([p])
 
 
-	def delete_key(self, key):
+	def neighbours(self, s):
+		return list(self._geo.neighbour_strings[self.point(s)])
 
-		key = str(key)
-		self._mutor_check(key)
 
-		self.props.pop(key, None)
+	def has_liberties(self, s):
 
+		p = self.point(s)
 
-	def dyer(self):
+		if self._buf[p] == _EMPTY:
+			return False
 
-		root = self.get_root()
-		node = root
-		dyer = {20: "??", 40: "??", 60: "??", 31: "??", 51: "??", 71: "??"}
-		move_count = 0
+		self._ensure_chains()
+		return self._nlibs[self._chain[p]] > 0
 
-		while True:
 
-			s = None
-			if "B" in node.props:
-				s = node.props["B"][0]
-			elif "W" in node.props:
-				s = node.props["W"][0]
+	def liberties_of(self, s):
+		return self.liberties_of_point(self.point(s))
 
-			if s != None:
-				move_count += 1
-				if move_count in [20, 40, 60, 31, 51, 71]:
-					p = root.validated_move_string(s)
-					if p:
-						dyer[move_count] = p
 
-			if len(node.children) == 0 or move_count >= 71:
+	def liberties_of_point(self, p):
+
+		self._check_point(p)
+
+		if self._buf[p] == _EMPTY:
+			return 0
+
+		self._ensure_chains()
+		return self._nlibs[self._chain[p]]
+
+
+	def chain_of(self, s):
+		p_to_s = self._geo.p_to_s
+		return [p_to_s[q] for q in self.chain_of_point(self.point(s))]
+
+
+	def chain_of_point(self, p):
+
+		self._check_point(p)
+
+		if self._buf[p] == _EMPTY:
+			return []
+
+		self._ensure_chains()
+		return self._chain_stones(p)
+
+
+	def _chain_stones(self, p):
+
+		nxt = self._next
+		ret = [p]
+		q = nxt[p]
+		while q != p:
+			ret.append(q)
+			q = nxt[q]
+		return ret
+
+
+	def _ensure_chains(self):
+
+		if self._chain is not None:
+			return
+
+		zeros = self._geo.zeros
+		self._chain = array("h", zeros)
+		self._next = array("h", zeros)
+		self._size = array("h", zeros)
+		self._nlibs = array("h", zeros)
+
+		buf = self._buf
+		chain = self._chain
+
+		for p in self._geo.points:
+			if buf[p] != _EMPTY and chain[p] == 0:
+				self._flood_chain(p)
+
+
+	def _flood_chain(self, p):
+
+		# Builds the chain containing p from scratch, with p as its head.
+
+		buf = self._buf
+		chain = self._chain
+		nxt = self._next
+		stride = self._geo.stride
+		colour = buf[p]
+
+		stones = [p]
+		libs = set()
+		chain[p] = p
+
+		for q in stones:		# Note: it's safe to iterate over a list that's getting appends like this is.
+			for n in (q + 1, q - 1, q + stride, q - stride):
+				c = buf[n]
+				if c == _EMPTY:
+					libs.add(n)
+				elif c == colour and chain[n] != p:
+					chain[n] = p
+					stones.append(n)
+
+		for i in range(len(stones) - 1):
+			nxt[stones[i]] = stones[i + 1]
+		nxt[stones[-1]] = p
+
+		self._size[p] = len(stones)
+		self._nlibs[p] = len(libs)
+
+
+	def _refresh_chains(self, changed):
+
+		# After arbitrary changes to the points in changed, dissolve every chain that was on or next
+		# to them and rebuild those chains from their stones. Costs O(size of the affected chains).
+
+		buf = self._buf
+		chain = self._chain
+		stride = self._geo.stride
+
+		old_heads = set()
+		for p in changed:
+			for n in (p, p + 1, p - 1, p + stride, p - stride):
+				if chain[n]:
+					old_heads.add(chain[n])
+
+		seeds = list(changed)
+		for h in old_heads:
+			for q in self._chain_stones(h):
+				chain[q] = 0
+				seeds.append(q)
+
+		for p in seeds:
+			for n in (p, p + 1, p - 1, p + stride, p - stride):
+				c = buf[n]
+				if c != _EMPTY and c != _EDGE and chain[n] == 0:
+					self._flood_chain(n)
+
+
+	def destroy_group(self, s):
+		return self._destroy_group(self.point(s))
+
+
+	def _destroy_group(self, p):
+
+		if self._undo:
+			self._refuse_while_pushed()
+
+		if self._buf[p] == _EMPTY:
+			return 0
+
+		self._ensure_chains()
+		return self._capture(self._chain[p])
+
+
+	def _capture(self, h):
+
+		# Removes the chain with head h, crediting the captures to the other colour.
+
+		buf = self._buf
+		chain = self._chain
+		nlibs = self._nlibs
+		stride = self._geo.stride
+
+		colour = buf[h]
+		stones = self._chain_stones(h)
+		keys = self._geo.zobrist[colour]
+
+		if self._chain_log is not None:
+			self._chain_log.append((h,))
+
+		for q in stones:
+			buf[q] = _EMPTY
+			chain[q] = 0
+			self._hash ^= keys[q]
+			if self._journal is not None:
+				self._journal += (q, colour)
+			if self._touched is not None:
+				self._touched.append(q)
+
+		for q in stones:
+			# Each distinct neighbouring chain gains q as a liberty...
+			a, b, c, d = chain[q + 1], chain[q - 1], chain[q + stride], chain[q - stride]
+			if a:
+				nlibs[a] += 1
+			if b and b != a:
+				nlibs[b] += 1
+			if c and c != a and c != b:
+				nlibs[c] += 1
+			if d and d != a and d != b and d != c:
+				nlibs[d] += 1
+
+		if colour == _BLACK:
+			self.caps_by_w += len(stones)
+		else:
+			self.caps_by_b += len(stones)
+
+		return len(stones)
+
+
+	def legal_move(self, s, superko = None):
+		return self.legal_move_colour(s, self.active, superko)
+
+
+	def legal_move_colour(self, s, colour, superko = None):		# Note: does not consider passes as "legal moves".
+
+		# If superko is given, it should be a collection of position_hash() values (e.g. from
+		# Node.position_hashes()) and moves recreating any of those positions are illegal.
+
+		assert(colour == "b" or colour == "w")
+
+		p = self._point_or_none(s)
+
+		if p == None:
+			return False						# s was malformed or out of bounds.
+		if self._buf[p]:
+			return False
+		if self.ko == s:
+			return False
+		if not self._not_suicide(p, _colour_codes[colour]):
+			return False
+		if superko != None and self._hash_after(p, _colour_codes[colour]) in superko:
+			return False
+
+		return True
+
+
+	def legal_moves(self, colour = None, superko = None):
+
+		# All the legal moves (not including passing) for colour (by default the side to move), as a
+		# list of integer points, found in one sweep. superko is as for legal_move_colour().
+
+		own = _colour_codes[colour or self.active]
+		assert(own == _BLACK or own == _WHITE)
+
+		ret = [m.start() for m in _legal_point.finditer(self._legal_mask(own))]
+
+		if superko != None:
+			ret = [p for p in ret if self._hash_after(p, own) not in superko]
+
+		return ret
+
+
+	def legal_moves_bits(self, colour = None, superko = None):
+
+		# As legal_moves(), but as an int with bit p set for each legal point p.
+
+		ret = 0
+		for p in self.legal_moves(colour, superko):
+			ret |= 1 << p
+		return ret
+
+
+	def legal_moves_mask(self, colour = None, superko = None):
+
+		# As legal_moves(), but as a NumPy bool array of shape (height, width). Needs NumPy.
+
+		_require_numpy()
+		mask = bytearray(self._geo.size)
+		for p in self.legal_moves(colour, superko):
+			mask[p] = 1
+		return _numpy_view(mask, self._geo).astype(bool)
+
+
+	def track_legal_moves(self, on = True):
+
+		# Keeps the legal moves of both colours up to date as the board changes, so that legal_moves()
+		# after a move only has to look at the points near whatever changed, rather than the whole
+		# board. Copies of the board carry on tracking.
+
+		if on:
+			if self._legal is None:
+				self._legal = [None, None, None]
+				self._touched = []
+		else:
+			self._legal = None
+			self._legal_ko = None
+			self._touched = None
+
+
+	def _legal_mask(self, own):
+
+		# Returns a bytes-like object over the buffer with 1 at each point where own can legally play.
+
+		if self._legal is None:
+			return self._sweep_legal(own)
+
+		if self._legal[own] is None:
+			self._legal[_BLACK] = self._sweep_legal(_BLACK)
+			self._legal[_WHITE] = self._sweep_legal(_WHITE)
+			self._legal_ko = self.ko
+			self._touched = []
+		elif self._touched or self._legal_ko != self.ko:
+			self._update_legal()
+
+		return self._legal[own]
+
+
+	def _sweep_legal(self, own):
+
+		# An empty point with an empty neighbour is always legal. Those are found all at once by
+		# treating the empty points as bytes of a big integer and shifting it; only the remaining
+		# (surrounded) empty points need their neighbouring chains checked.
+
+		geo = self._geo
+		stride = geo.stride
+		size = geo.size
+
+		empty = int.from_bytes(self._buf.translate(_empty_bytes), "little")
+		near_empty = (empty << 8) | (empty >> 8) | (empty << (8 * stride)) | (empty >> (8 * stride))
+		mask = bytearray((empty & near_empty).to_bytes(size, "little"))
+
+		for m in _legal_point.finditer((empty & ~near_empty).to_bytes(size, "little")):
+			p = m.start()
+			mask[p] = self._not_suicide(p, own)
+
+		if self.ko:
+			p = geo.s_to_p.get(self.ko)
+			if p:
+				mask[p] = 0
+
+		return mask
+
+
+	def _update_legal(self):
+
+		# Legality at an empty point depends only on its neighbours and the liberty counts of their
+		# chains, so after changes at some points only they, their neighbours, and the liberties of
+		# chains next to them (whose counts may have changed) need looking at, plus the ko points.
+
+		self._ensure_chains()
+
+		buf = self._buf
+		chain = self._chain
+		stride = self._geo.stride
+		s_to_p = self._geo.s_to_p
+
+		dirty = set()
+		heads = set()
+
+		for p in self._touched:
+			for n in (p, p + 1, p - 1, p + stride, p - stride):
+				dirty.add(n)
+				if chain[n]:
+					heads.add(chain[n])
+
+		for h in heads:
+			for q in self._chain_stones(h):
+				for n in (q + 1, q - 1, q + stride, q - stride):
+					if buf[n] == _EMPTY:
+						dirty.add(n)
+
+		for ko in (self.ko, self._legal_ko):
+			if ko and ko in s_to_p:
+				dirty.add(s_to_p[ko])
+
+		ko_p = s_to_p.get(self.ko) if self.ko else None
+		black = self._legal[_BLACK]
+		white = self._legal[_WHITE]
+
+		for p in dirty:
+			if buf[p] != _EMPTY or p == ko_p:
+				black[p] = 0
+				white[p] = 0
+			else:
+				black[p] = self._not_suicide(p, _BLACK)
+				white[p] = self._not_suicide(p, _WHITE)
+
+		self._touched = []
+		self._legal_ko = self.ko
+
+
+	def _not_suicide(self, p, own):
+
+		buf = self._buf
+		stride = self._geo.stride
+		neighbours = (p + 1, p - 1, p + stride, p - stride)
+
+		for n in neighbours:
+			if buf[n] == _EMPTY:
+				return True						# New stone has a liberty.
+
+		self._ensure_chains()
+
+		chain = self._chain
+		nlibs = self._nlibs
+
+		for n in neighbours:					# Note that p is necessarily one of each such chain's liberties.
+			c = buf[n]
+			if c == own:
+				if nlibs[chain[n]] > 1:
+					return True					# One of the groups we're joining has a liberty other than p.
+			elif c != _EDGE:
+				if nlibs[chain[n]] == 1:
+					return True					# One of the enemy groups has no liberties other than p.
+
+		return False
+
+
+	def _hash_after(self, p, own):
+
+		# The position_hash() that a legal move by own at p would lead to.
+
+		self._ensure_chains()
+
+		buf = self._buf
+		chain = self._chain
+		stride = self._geo.stride
+		zobrist = self._geo.zobrist
+
+		h = self._hash ^ zobrist[own][p]
+		captured = []
+
+		for n in (p + 1, p - 1, p + stride, p - stride):
+			c = buf[n]
+			if c != _EMPTY and c != _EDGE and c != own and self._nlibs[chain[n]] == 1 and chain[n] not in captured:
+				captured.append(chain[n])
+				for q in self._chain_stones(n):
+					h ^= zobrist[c][q]
+
+		return h
+
+
+	def play_move_or_pass(self, s, colour):
+
+		assert(colour == "b" or colour == "w")
+
+		if self._undo:
+			self._refuse_while_pushed()
+
+		self._play(self._point_or_none(s), colour)
+
+
+	def _play(self, p, colour):
+
+		self.ko = None
+		self.active = "b" if colour == "w" else "w"
+
+		if p == None:
+			return					# s was invalid in some way; treat as a pass.
+
+		if self._chain is None:
+			self._ensure_chains()
+
+		buf = self._buf
+		chain = self._chain
+		nlibs = self._nlibs
+		stride = self._geo.stride
+		own = _colour_codes[colour]
+
+		neighbours = (p + 1, p - 1, p + stride, p - stride)
+
+		zobrist = self._geo.zobrist
+		self._hash ^= zobrist[buf[p]][p] ^ zobrist[own][p]
+
+		if self._journal is not None:
+			self._journal += (p, buf[p])
+		if self._touched is not None:
+			self._touched.append(p)
+
+		if buf[p] != _EMPTY:					# Playing on top of an existing stone. Odd, but historically
+			buf[p] = own						# this has been allowed, so handle it the slow way.
+			self._refresh_chains([p])
+		else:
+			buf[p] = own
+			# Each distinct neighbouring chain loses p as a liberty...
+			a, b, c, d = chain[p + 1], chain[p - 1], chain[p + stride], chain[p - stride]
+			if a:
+				nlibs[a] -= 1
+			if b and b != a:
+				nlibs[b] -= 1
+			if c and c != a and c != b:
+				nlibs[c] -= 1
+			if d and d != a and d != b and d != c:
+				nlibs[d] -= 1
+			chain[p] = p
+			self._next[p] = p
+			self._size[p] = 1
+			nlibs[p] = (buf[p + 1] == _EMPTY) + (buf[p - 1] == _EMPTY) + (buf[p + stride] == _EMPTY) + (buf[p - stride] == _EMPTY)
+			for n in neighbours:
+				if buf[n] == own and chain[n] != chain[p]:
+					self._merge_chains(chain[p], chain[n])
+
+		caps = 0
+
+		for n in neighbours:
+			h = chain[n]
+			if h and buf[n] != own and nlibs[h] == 0:
+				caps += self._capture(h)
+
+		h = chain[p]
+
+		if nlibs[h] == 0:
+			self._capture(h)					# Suicide.
+		elif caps == 1 and self._size[h] == 1 and nlibs[h] == 1:
+			for n in neighbours:
+				if buf[n] == _EMPTY:
+					self.ko = self._geo.p_to_s[n]
+
+
+	def push(self, s, colour):
+
+		# Plays a move exactly as play_move_or_pass() does, but so that pop() can take it back, for
+		# searching in place rather than on copies. Each entry on the undo stack holds the state that
+		# isn't a point, plus where the move's changes start in the journal (which is turned on for
+		# as long as anything is pushed) and in the chain log, which records each merge and capture
+		# so pop() can reverse them exactly. Copies of the board start with an empty undo stack.
+		#
+		# pop() relies on the board only having been changed by push() since, so while any moves are
+		# pushed, every other way of changing the stones (play_move_or_pass(), set_at(), writing to
+		# state, destroy_group() and so on) raises RuntimeError. Direct changes to ko, active and the
+		# capture counts are simply undone by pop().
+
+		assert(colour == "b" or colour == "w")
+
+		if self._chain is None:
+			self._ensure_chains()
+
+		if self._chain_log is None:
+			self._undo = []
+			self._chain_log = []
+
+		owned = self._journal is None
+		if owned:
+			self._journal = []
+
+		p = self._point_or_none(s)
+		old = None
+		snapshot = None
+
+		if p != None:
+			old = (self._next[p], self._size[p], self._nlibs[p])
+			if self._buf[p] != _EMPTY:		# _play() will rebuild chains the slow way, which can't be
+											# reversed step by step, so just keep a copy of them.
+				snapshot = (self._chain[:], self._next[:], self._size[:], self._nlibs[:])
+
+		self._undo.append((len(self._journal), len(self._chain_log), owned,
+			self.ko, self.active, self.caps_by_b, self.caps_by_w, self._hash, p, old, snapshot))
+
+		self._play(p, colour)
+
+
+	def pop(self):
+
+		# Takes back the last move made by push().
+
+		if not self._undo:
+			raise IndexError("pop() without a move to take back")
+
+		start, log_start, owned, self.ko, self.active, self.caps_by_b, self.caps_by_w, self._hash, p, old, snapshot = self._undo.pop()
+
+		buf = self._buf
+		journal = self._journal
+
+		for i in range(len(journal) - 2, start - 1, -2):		# Newest first, so each point ends up as it was
+			buf[journal[i]] = journal[i + 1]
+
+		if self._touched is not None:
+			self._touched += journal[start::2]
+
+		if snapshot:
+			self._chain[:], self._next[:], self._size[:], self._nlibs[:] = snapshot
+		elif p != None:
+			self._unplay(p, old, log_start)
+
+		del journal[start:]
+		if owned:
+			self._journal = None
+
+		del self._chain_log[log_start:]
+		if not self._undo:
+			self._chain_log = None
+
+
+	def _refuse_while_pushed(self):
+		raise RuntimeError("Board changed while moves are pushed; pop() them first")
+
+
+	def _unplay(self, p, old, log_start):
+
+		# Restores the chain tables to how they were before the stone at p was played, by undoing
+		# the logged merges and captures newest first, so each sees the labels it originally saw.
+
+		chain = self._chain
+		nxt = self._next
+		size = self._size
+		nlibs = self._nlibs
+		stride = self._geo.stride
+		log = self._chain_log
+
+		for i in range(len(log) - 1, log_start - 1, -1):
+			entry = log[i]
+			if len(entry) == 1:
+				# A capture. The stones' _next links were left alone, so the chain can be walked...
+				h = entry[0]
+				stones = self._chain_stones(h)
+				for q in stones:
+					a, b, c, d = chain[q + 1], chain[q - 1], chain[q + stride], chain[q - stride]
+					if a:
+						nlibs[a] -= 1
+					if b and b != a:
+						nlibs[b] -= 1
+					if c and c != a and c != b:
+						nlibs[c] -= 1
+					if d and d != a and d != b and d != c:
+						nlibs[d] -= 1
+				for q in stones:
+					chain[q] = h
+			else:
+				# A merge. Swapping the same two links again splits the circular list back in two...
+				h1, h2, libs = entry
+				nxt[h1], nxt[h2] = nxt[h2], nxt[h1]
+				size[h1] -= size[h2]
+				nlibs[h1] = libs
+				for q in self._chain_stones(h2):
+					chain[q] = h2
+
+		chain[p] = 0
+		nxt[p], size[p], nlibs[p] = old
+
+		a, b, c, d = chain[p + 1], chain[p - 1], chain[p + stride], chain[p - stride]
+		if a:
+			nlibs[a] += 1
+		if b and b != a:
+			nlibs[b] += 1
+		if c and c != a and c != b:
+			nlibs[c] += 1
+		if d and d != a and d != b and d != c:
+			nlibs[d] += 1
+
+
+	def _merge_chains(self, h1, h2):
+
+		# Merges two chains of the same colour, relabelling the smaller. Returns the surviving head.
+
+		size = self._size
+		nlibs = self._nlibs
+
+		if size[h1] < size[h2]:
+			h1, h2 = h2, h1
+
+		if self._chain_log is not None:
+			self._chain_log.append((h1, h2, nlibs[h1]))
+
+		buf = self._buf
+		chain = self._chain
+		nxt = self._next
+		stride = self._geo.stride
+
+		# Count the liberties the two chains have in common, so the merged count is exact...
+
+		shared = 0
+		counted = set()
+
+		q = h2
+		while True:
+			for l in (q + 1, q - 1, q + stride, q - stride):
+				if buf[l] == _EMPTY and l not in counted:
+					counted.add(l)
+					if chain[l + 1] == h1 or chain[l - 1] == h1 or chain[l + stride] == h1 or chain[l - stride] == h1:
+						shared += 1
+			chain[q] = h1					# Safe to relabel as we go: each l is examined when first seen,
+											# before any of its h2 neighbours have been relabelled.
+			q = nxt[q]
+			if q == h2:
 				break
 
-			node = node.children[0]
+		nxt[h1], nxt[h2] = nxt[h2], nxt[h1]			# Splice the circular lists together.
+		size[h1] += size[h2]
+		nlibs[h1] += nlibs[h2] - shared
+
+		return h1
+
+
+	def _make_delta(self):
+
+		# Summarises the changes recorded in the journal (plus everything that isn't a point) as a
+		# tuple which _apply_delta() can replay onto the board as it was when the journal started.
+
+		buf = self._buf
+		journal = self._journal
+		changes = []
+		seen = set()
+
+		for i in range(0, len(journal), 2):
+			p = journal[i]
+			if p not in seen:
+				seen.add(p)
+				changes.append(p)
+				changes.append(buf[p])
+
+		return (tuple(changes), self.ko, self.active, self.caps_by_b, self.caps_by_w, self._hash)
+
+
+	def _apply_delta(self, delta):
+
+		if self._undo:
+			self._refuse_while_pushed()
+
+		changes, self.ko, self.active, self.caps_by_b, self.caps_by_w, self._hash = delta
+
+		buf = self._buf
+		for i in range(0, len(changes), 2):
+			buf[changes[i]] = changes[i + 1]
+
+		self._chain = None						# Chains are rebuilt lazily if anyone needs them.
+		self._next = None
+		self._size = None
+		self._nlibs = None
+
+		if self._legal is not None:
+			self._legal = [None, None, None]
+
+def _apply_setup(board, ae, ab, aw):
+
+	# The AE, AB and AW part of Node.apply(), given the values of each (which can be compressed
+	# point lists such as "aa:cc").
+
+	for values, colour in ((ae, ""), (ab, "b"), (aw, "w")):
+		for s in values:
+			if len(s) == 5:
+				for z in points_list(s):
+					try:
+						board.set_at(z, colour)
+					except:
+						pass
+			else:
+				try:
+					board.set_at(s, colour)
+				except:
+					pass
+
+	# Note that setup doesn't change board.active; we likely shouldn't do that.
+
+
+def _apply_pl(board, pl):
+
+	if pl == "B" or pl == "b":
+		board.active = "b"
+	if pl == "W" or pl == "w":
+		board.active = "w"
+
+
+def _sz_dimensions(sz):
+
+	# SZ value --> width, height
+
+	if sz == None:
+		return 19, 19
+
+	strings = sz.split(":") if ":" in sz else [sz, sz]
+	ret = []
+
+	for size_string in strings[:2]:
+		try:
+			ret.append(min(int(size_string), 52))
+		except:
+			ret.append(19)
+
+	return ret[0], ret[1]
+
+# -------------------------------------------------------------------------------------------------
+
+class Node:
+
+	# By default every node whose board is needed caches a full Board. If checkpoint_interval is set
+	# to some k > 0, full boards are only kept every k plies and at branch points; other nodes keep
+	# a small delta from their parent's board, and are rebuilt from the nearest checkpoint.
+
+	checkpoint_interval = 0
+
+	# If board_cache is set to a BoardCache, the number of full boards cached across all trees is
+	# limited to its budget, with the least recently used being evicted.
+
+	board_cache = None
+
+	# Nodes are numerous, so they have no __dict__. In props, a key with a single value (the usual
+	# case) maps straight to the value; only keys with several values map to a list.
+
+	__slots__ = ("parent", "children", "props", "_board", "_delta", "__weakref__")
+
+	def __init__(self, parent = None):
+
+		self.parent = parent
+		self.children = []
+		self.props = dict()
+		self._board = None
+		self._delta = None
+
+		if parent:
+			parent.children.append(self)
+
+
+	@property
+	def width(self):
+
+		if self._board:
+			return self._board.width
+
+		return _sz_dimensions(self.get_root().get("SZ"))[0]
+
+
+	@property
+	def height(self):
+
+		if self._board:
+			return self._board.height
+
+		return _sz_dimensions(self.get_root().get("SZ"))[1]
+
+
+	def apply(self, board):
+
+		_apply_setup(board, self.all_values("AE"), self.all_values("AB"), self.all_values("AW"))
+
+		for s in self.all_values("B"):
+			board.play_move_or_pass(s, "b")		# Will treat s as a pass if it's not a valid move.
+
+		for s in self.all_values("W"):
+			board.play_move_or_pass(s, "w")		# Will treat s as a pass if it's not a valid move.
+
+		if not self.parent:
+			if self.has_key("AB") and not self.has_key("AW") and not self.has_key("B") and not self.has_key("W"):
+				board.active = "w"
+
+		_apply_pl(board, self.get("PL"))
+
+
+	def _cache_board(self):
+
+		# Returns the board at this node, which the caller must not modify.
+		# Also caches the entire history (not doing so is silly, I guess).
+
+		cache = self.board_cache
+
+		if self._board:
+			if cache != None:
+				cache.hits += 1
+				cache._touch(self)
+			return self._board
+
+		if cache != None:
+			cache.misses += 1
+
+		node = self
+		history = []
+		work_board = None
+
+		while node:
+			if node._board:
+				work_board = node._board.copy()
+				if cache != None:
+					cache._touch(node)
+				break
+			else:
+				history.append(node)
+				node = node.parent
+
+		history.reverse()
+
+		if not work_board:
+			work_board = Board(self.width, self.height)
+
+		# Decide which nodes get a full board: every node, or with checkpoints only every interval
+		# plies and at branch points. With a cache, only the last max_boards of those would survive
+		# this call, so there's no point copying boards for the others only to evict them at once.
+
+		interval = self.checkpoint_interval
+		since = 0
+		keep = []
+
+		for i, node in enumerate(history):
+			since += 1
+			if not interval or since >= interval or len(node.children) > 1:
+				keep.append(i)
+				since = 0
+
+		if cache != None:
+			keep = keep[len(keep) - cache.max_boards:] if cache.max_boards > 0 else []
+
+		keep = set(keep)
+
+		for i, node in enumerate(history):
+			if node._delta:
+				work_board._apply_delta(node._delta)
+			elif interval:
+				work_board._journal = []
+				node.apply(work_board)
+				node._delta = work_board._make_delta()
+				work_board._journal = None
+			else:
+				node.apply(work_board)
+			if i in keep:
+				node._board = work_board.copy()
+				if cache != None:
+					cache._add(node)
+
+		return self._board or work_board
+
+
+	def make_board(self):
+		return self._cache_board().copy()
+
+
+	def get_root(self):
+
+		node = self
+		while node.parent:
+			node = node.parent
+		return node
+
+
+	def get_end(self):
+
+		node = self
+		while len(node.children) > 0:
+			node = node.children[0]
+		return node
+
+
+	def history(self):
+
+		node = self
+		ret = []
+
+		while node:
+			ret.append(node)
+			node = node.parent
+
+		ret.reverse()
+		return ret
+
+
+	def set(self, key, value):
+
+		key = sys.intern(str(key))
+		value = str(value)
+		self._mutor_check(key)
+
+		self.props[key] = value
+
+
+	def get(self, key):
+
+		key = str(key)
+
+		if key not in self.props:
+			return ""
+		value = self.props[key]
+		if type(value) is list:
+			values = value
+			value = values[0]
+			if type(value) is _LazyValue:
+				value = values[0] = value.decode()
+		elif type(value) is _LazyValue:
+			value = self.props[key] = value.decode()
+		return value
+
+
+	def has_key(self, key):
+
+		return str(key) in self.props
+
+
+	def all_values(self, key):
+
+		key = str(key)
+
+		if key not in self.props:
+			return []
+		values = self.props[key]
+		if type(values) is not list:
+			if type(values) is _LazyValue:
+				values = self.props[key] = values.decode()
+			return [values]
+		for i, value in enumerate(values):
+			if type(value) is _LazyValue:
+				values[i] = value.decode()
+		return values[:]
+
+
+	def add_value(self, key, value):
+
+		key = sys.intern(str(key))
+		value = str(value)
+		self._mutor_check(key)
+
+		self.add_value_fast(key, value)
+
+
+	def add_value_fast(self, key, value):
+
+		values = self.props.get(key)
+		if values is None:
+			self.props[key] = value
+		elif type(values) is list:
+			values.append(value)
+		else:
+			self.props[key] = [values, value]
+
+
+	def delete_key(self, key):
+
+		key = str(key)
+		self._mutor_check(key)
+
+		self.props.pop(key, None)
+
+
+	def dyer(self):
+
+		root = self.get_root()
+		node = root
+		dyer = {20: "??", 40: "??", 60: "??", 31: "??", 51: "??", 71: "??"}
+		move_count = 0
+
+		while True:
+
+			s = None
+			if "B" in node.props:
+				s = node.get("B")
+			elif "W" in node.props:
+				s = node.get("W")
+
+			if s != None:
+				move_count += 1
+				if move_count in [20, 40, 60, 31, 51, 71]:
+					p = root.validated_move_string(s)
+					if p:
+						dyer[move_count] = p
+
+			if len(node.children) == 0 or move_count >= 71:
+				break
+
+			node = node.children[0]
+
+		return dyer[20] + dyer[40] + dyer[60] + dyer[31] + dyer[51] + dyer[71]
+
+
+	def validated_move_string(self, s):
+
+		# Returns s if s is an on-board SGF string, otherwise returns ""
+
+		if not isinstance(s, str):
+			return ""
+
+		xy = _s_to_xy_table.get(s)
+
+		if xy and xy[0] < self.width and xy[1] < self.height:
+			return s
+		else:
+			return ""
+
+
+	def subtree_size(self):			# Including self
+
+		todo = [self]
+		n = 0
+
+		while todo:
+			node = todo.pop()
+			while True:
+				n += 1
+				if len(node.children) == 1:
+					node = node.children[0]
+				else:
+					todo.extend(node.children)
+					break
+
+		return n
+
+
+	def tree_size(self):
+		return self.get_root().subtree_size()
+
+
+	def make_move(self, s, superko = False):			# This method cannot be used for passing
+
+		board = self._cache_board()
+
+		if not board.legal_move(s, self.position_hashes() if superko else None):
+			raise IllegalMove
+
+		colourkey = board.active.upper()
+
+		for node in self.children:
+			if node.get(colourkey) == s:
+				return node
+
+		node = Node(self)
+		node.set(colourkey, s)
+
+		return node
+
+
+	def position_hashes(self):
+
+		# The position_hash() of the board at every node from the root to here, for superko checks.
+
+		self._cache_board()
+		return set(node._position_hash() for node in self.history())
+
+
+	def _position_hash(self):
+
+		if self._board:
+			return self._board.position_hash()
+		if self._delta:
+			return self._delta[5]
+		return self._cache_board().position_hash()
+
+
+	def make_pass(self):
+
+		colourkey = self._cache_board().active.upper()
+
+		for node in self.children:
+			if node.has_key(colourkey):
+				if self.validated_move_string(node.get(colourkey)) == "":
+					return node
+
+		node = Node(self)
+		node.set(colourkey, "")
+
+		return node
+
+
+	def _mutor_check(self, key):	# With board caches, these properties require a recursive cache clear
+
+		if key in ["B", "W", "AB", "AW", "AE", "PL", "SZ"]:
+			self._clear_board_recursive()
+
+
+	def _clear_board_recursive(self):			# Clears the whole subtree, though not by actual recursion.
+
+		todo = [self]
+
+		while todo:
+			node = todo.pop()
+			while True:
+				if node._board and node.board_cache != None:
+					node.board_cache._forget(node)
+				node._board = None
+				node._delta = None
+				if len(node.children) == 1:
+					node = node.children[0]
+				else:
+					todo.extend(node.children)
+					break
+
+# -------------------------------------------------------------------------------------------------
+
+class BoardCache:
+
+	# Budget for the full boards cached on Nodes, see Node.board_cache. Nodes are only held by weak
+	# reference, so this never keeps a tree alive. An evicted node simply loses its board and will
+	# recompute it from its nearest cached ancestor when next needed.
+
+	def __init__(self, max_boards):
+
+		self.max_boards = max_boards
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+		self._lru = OrderedDict()				# id(node) --> weakref to node, least recent first
+
+
+	def __len__(self):
+		return len(self._lru)
+
+
+	def stats(self):
+		return {"boards": len(self._lru), "max_boards": self.max_boards, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+	def reset_stats(self):
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def clear(self):
+		while self._lru:
+			self._evict_oldest()
+
+
+	def _touch(self, node):
+		key = id(node)
+		if key in self._lru:
+			self._lru.move_to_end(key)
+
+
+	def _add(self, node):
+
+		key = id(node)
+		lru = self._lru
+
+		if key in lru:
+			lru.move_to_end(key)
+		else:
+			lru[key] = weakref.ref(node, lambda ref, key = key: lru.pop(key, None))
+
+		while len(lru) > self.max_boards:
+			self._evict_oldest()
+
+
+	def _forget(self, node):
+		self._lru.pop(id(node), None)
+
+
+	def _evict_oldest(self):
+
+		key, ref = self._lru.popitem(last = False)
+		node = ref()
+
+		if node and node._board:
+			node._board = None
+			self.evictions += 1
+
+# -------------------------------------------------------------------------------------------------
+
+# Lookup tables for s_to_xy() and xy_to_s(), covering all 52 x 52 points.
+
+_sgf_letters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_s_to_xy_table = {a + b: (x, y) for x, a in enumerate(_sgf_letters) for y, b in enumerate(_sgf_letters)}
+_xy_to_s_table = [a + b for a in _sgf_letters for b in _sgf_letters]		# Indexed by x * 52 + y
+_sgf_point_codes = {(a + b).encode(): x + y * 52 for x, a in enumerate(_sgf_letters) for y, b in enumerate(_sgf_letters)}
+
+
+def s_to_xy(s):						# "cc" --> 2,2
+
+	try:
+		return _s_to_xy_table[s]
+	except (KeyError, TypeError):
+		pass
+
+	if not isinstance(s, str):
+		raise TypeError
+
+	raise ValueError
+
+
+def xy_to_s(x, y):					# 2,2 --> "cc"
+
+	if x < 0 or x >= 52 or y < 0 or y >= 52:
+		raise ValueError
+
+	return _xy_to_s_table[x * 52 + y]
+
+
+def english_to_xy(e, height = 19, i_adjust = True):		# "Q16"     --->    15,3
+
+	if not isinstance(e, str):
+		raise TypeError
+
+	if len(e) != 2 and len(e) != 3:
+		raise ValueError
+
+	e = e.upper()
+
+	if e[0] not in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+		raise ValueError
+
+	x = ord(e[0]) - 65
+
+	if i_adjust:
+		if e[0] == "I":
+			raise ValueError
+		if x > 7:
+			x -= 1
+
+	try:
+		y = height - int(e[1:])
+	except:
+		raise ValueError
+
+	if y < 0 or y >= height:
+		raise ValueError
+
+	return (x, y)
+
+
+def safe_string(s):     			# "safe" meaning safely escaped \ and ] characters
+	s = s.replace("\\", "\\\\")
+	s = s.replace("]", "\\]")
+	return s
+
+
+def handicap_stones(count, width, height, tygem = False):
+
+	# From the Sabaki project by Yichuan Shen, with modifications.
+	# https://github.com/SabakiHQ/go-board
+
+	if min(width, height) <= 6 or count < 2:
+		return []
+
+	nearx = 3 if width >= 13 else 2
+	neary = 3 if height >= 13 else 2
+	farx = width - nearx - 1
+	fary = height - neary - 1
+	middlex = (width - 1) // 2
+	middley = (height - 1) // 2
+
+	if tygem:
+		stones = [[nearx, fary], [farx, neary], [nearx, neary], [farx, fary]]
+	else:
+		stones = [[nearx, fary], [farx, neary], [farx, fary], [nearx, neary]]
+
+	if width % 2 != 0 and height % 2 != 0 and (width >= 9 or height >= 9):
+
+		if count == 5 or count == 7 or count >= 9:
+			stones.append([middlex, middley])
+
+		stones += [
+			[nearx, middley],
+			[farx, middley],
+			[middlex, neary],
+			[middlex, fary]
+		]
+
+	return [xy_to_s(z[0], z[1]) for z in stones[0:count]]
+
+
+def points_list(s):
+
+	if len(s) == 2:
+		return [s]
+
+	if len(s) != 5 or s[2] != ":":
+		return []
+
+	try:
+		x1, y1 = _s_to_xy_table[s[0:2]]
+		x2, y2 = _s_to_xy_table[s[3:5]]
+	except:
+		return []
+
+	if x1 > x2:
+		x1, x2 = x2, x1
+
+	if y1 > y2:
+		y1, y2 = y2, y1
+
+	return [_xy_to_s_table[x * 52 + y] for x in range(x1, x2 + 1) for y in range(y1, y2 + 1)]
+
+# -------------------------------------------------------------------------------------------------
+
+def save(filename, node):
+
+	# A filename ending in .gz, .bz2 or .xz gets compressed output.
+
+	opener = _compression_openers.get(os.path.splitext(filename)[1].lower(), open)
+	with opener(filename, "wt", encoding="utf-8") as outfile:
+		dump(node, outfile)
+
+
+def dumps(node):
+
+	# Returns the SGF of the whole game containing the node.
+
+	chunks = []
+	_write_sgf(node.get_root(), chunks.append)
+	return "".join(chunks)
+
+
+def dump(node, fileobj):
+
+	# Writes the SGF of the whole game containing the node, as text, or as UTF-8 if the file object
+	# is binary.
+
+	if isinstance(fileobj, io.TextIOBase):
+		_write_sgf(node.get_root(), fileobj.write)
+	else:
+		_write_sgf(node.get_root(), lambda s: fileobj.write(s.encode("utf-8")))
+
+
+def _write_sgf(node, write):
+
+	# Writes the subtree at node by building the output in a list of parts, passing it to write()
+	# joined up every so often. The todo stack holds nodes that start a subtree, and the ")"
+	# strings that close them.
+
+	parts = []
+	append = parts.append
+	todo = [node]
+
+	while todo:
+		node = todo.pop()
+		if type(node) is str:
+			append(node)
+			continue
+		sep = "(;"											# Written along with the node's first property
+		while True:
+			for key, value in node.props.items():
+				if type(value) is str:						# The usual case, a single decoded value
+					if "\\" in value or "]" in value:
+						value = safe_string(value)
+					append(f"{sep}{key}[{value}]")
+				else:
+					append(sep + key)
+					for value in (value if type(value) is list else [value]):
+						if type(value) is _LazyValue:
+							value = value.decode()			# Without keeping it, since we're only saving.
+						if "\\" in value or "]" in value:
+							value = safe_string(value)
+						append(f"[{value}]")
+				sep = ""
+			if sep:
+				append(sep)
+			if len(parts) > 8192:
+				write("".join(parts))
+				parts.clear()
+			children = node.children
+			if len(children) == 1:
+				node = children[0]
+				sep = ";"
+			else:
+				todo.append(")")
+				todo.extend(reversed(children))
+				break
+
+	write("".join(parts))
+
+
+_lazy_mmap_size = 1 << 20										# Smallest file that lazy loads map
+
+
+def load(filename, headers_only = False, mainline_only = False, lazy = False):
+
+	# This can throw.
+	# Otherwise, returns a non-empty array of roots.
+	# See load_sgf() for the modes. GIB and NGF only have a main line anyway.
+	# Lazy loads of big files map the file rather than reading it, so undecoded values cost no heap.
+	# Small files are just read, since each map holds a file descriptor open for as long as the
+	# tree lives, and thousands of lazily loaded files would run out of them.
+	#
+	# Files compressed with gzip, bzip2 or xz are decompressed on the fly, and zip and tar archives
+	# (compressed or not) give the games of all their SGF, GIB and NGF members, in order, including
+	# members compressed by themselves, e.g. "x.sgf.gz". Files are recognised by their first bytes,
+	# not just by extension (but members by extension only). Lazy has no effect on them.
+
+	opener, archive = _sniff(filename)
+
+	if archive:
+		roots = []
+		try:
+			for name, fileobj in _archive_members(filename, archive):
+				roots.extend(_load_member(name, fileobj.read(), headers_only, mainline_only))
+		except _decompression_errors as err:
+			raise ParserFail("Archive load error: {}".format(err)) from None
+		if len(roots) == 0:
+			raise ParserFail("Archive load error: Found no game")
+		return roots
+
+	if opener:
+		try:
+			with opener(filename, "rb") as infile:
+				buf = infile.read()
+		except _decompression_errors as err:
+			raise ParserFail("Decompression error: {}".format(err)) from None
+		return _load_buf(_strip_compression(filename), buf, headers_only, mainline_only, False)
+
+	with open(filename, "rb") as infile:
+		if lazy and not filename.lower().endswith((".gib", ".ngf")) and os.fstat(infile.fileno()).st_size >= _lazy_mmap_size:
+			try:
+				buf = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+			except (OSError, ValueError):
+				buf = infile.read()
+		else:
+			buf = infile.read()
+
+	return _load_buf(filename, buf, headers_only, mainline_only, lazy)
+
+
+def _load_buf(filename, buf, headers_only, mainline_only, lazy):
+
+	# Dispatches on the extension.
+
+	if filename.lower().endswith(".gib"):
+		roots = load_gib(buf)
+	elif filename.lower().endswith(".ngf"):
+		roots = load_ngf(buf)
+	else:
+		return load_sgf(buf, headers_only, mainline_only, lazy)
+
+	if headers_only:
+		for root in roots:
+			for child in root.children:
+				child.parent = None
+			root.children = []
+
+	return roots
+
+
+def _load_member(name, buf, headers_only, mainline_only):
+
+	# As _load_buf(), but errors say which archive member was at fault.
+
+	try:
+		return _load_buf(_strip_compression(name), buf, headers_only, mainline_only, False)
+	except ParserFail as err:
+		raise ParserFail("{}: {}".format(name, err)) from None
+
+
+# -------------------------------------------------------------------------------------------------
+# Compressed files and archives. Detection is by magic bytes first, so misnamed files still work;
+# the extension decides only for output, and for old tar files without the "ustar" marker.
+
+_load_extensions = (".sgf", ".gib", ".ngf")						# Members of archives that get loaded
+
+_compression_magic = ((b"\x1f\x8b", gzip.open), (b"BZh", bz2.open), (b"\xfd7zXZ\x00", lzma.open))
+_compression_openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+_tar_extensions = (".tar", ".tgz", ".tbz2", ".txz", ".tar.gz", ".tar.bz2", ".tar.xz")
+_zip_magic = (b"PK\x03\x04", b"PK\x05\x06")						# The latter for an empty zip
+_decompression_errors = (OSError, EOFError, lzma.LZMAError, zlib.error, zipfile.BadZipFile, tarfile.TarError)
+
+
+def _sniff(filename):
+
+	# Returns (opener, archive) where opener is the function that opens the file decompressed (or
+	# None if it isn't compressed) and archive is "zip", "tar", or None.
+
+	with open(filename, "rb") as infile:
+		head = infile.read(512)
+
+	if head.startswith(_zip_magic):
+		return None, "zip"
+
+	opener = None
+	for magic, f in _compression_magic:
+		if head.startswith(magic):
+			opener = f
+			with opener(filename, "rb") as infile:
+				try:
+					head = infile.read(512)
+				except (OSError, EOFError, lzma.LZMAError):		# Corrupt; the loader will complain
+					return opener, None
+			break
+
+	if head[257:262] == b"ustar" or filename.lower().endswith(_tar_extensions):
+		return opener, "tar"
+
+	return opener, None
+
+
+def _strip_compression(filename):
+	stem, ext = os.path.splitext(filename)
+	return stem if ext.lower() in _compression_openers else filename
+
+
+def _archive_members(filename, archive):
+
+	# Yields (name, fileobj) for each member that is a game record, in archive order. Each fileobj
+	# streams from the archive (decompressing the member if it's compressed by itself) and is only
+	# valid until the next one is yielded.
+
+	if archive == "zip":
+		with zipfile.ZipFile(filename) as z:
+			for info in z.infolist():
+				if not info.is_dir() and _strip_compression(info.filename).lower().endswith(_load_extensions):
+					with z.open(info) as fileobj:
+						yield info.filename, _member_stream(info.filename, fileobj)
+	else:
+		with tarfile.open(filename, "r:*") as t:
+			for info in t:
+				if info.isfile() and _strip_compression(info.name).lower().endswith(_load_extensions):
+					yield info.name, _member_stream(info.name, t.extractfile(info))
+
+
+def _member_stream(name, fileobj):
+	opener = _compression_openers.get(os.path.splitext(name)[1].lower())
+	return opener(fileobj, "rb") if opener else fileobj
+
+
+def load_sgf(buf, headers_only = False, mainline_only = False, lazy = False):
+
+	# Always returns at least 1 game; or throws if it cannot.
+	#
+	# With headers_only, each game is just its root node; with mainline_only, variations other than
+	# the first are dropped. Either way the skipped parts are only scanned for parens and values,
+	# so errors in them go unnoticed.
+	#
+	# With lazy, long values (comments etc) are left undecoded in the buffer until first read via
+	# get() or all_values(). Such trees keep the buffer alive, and their props dicts may contain
+	# _LazyValue objects, so read them with the methods rather than directly.
+
+	if type(buf) is str:
+		buf = buf.encode(encoding="utf-8", errors="replace")
+	elif type(buf) is not bytes and type(buf) is not mmap.mmap:
+		buf = bytes(buf)
+
+	ret = []
+	off = 0
+
+	with _GCPause():
+		while len(buf) - off >= 3:
+			try:
+				o = _load_sgf_game(buf, off, headers_only, mainline_only, lazy)
+				ret.append(o.root)
+				off += o.readcount
+			except:
+				if len(ret) > 0:
+					break
+				else:
+					raise
+
+	if len(ret) == 0:
+		raise ParserFail("SGF load error: Found no game")
+
+	return ret
+
+
+def iter_sgf(source, chunk_size = 1 << 20, headers_only = False, mainline_only = False, lazy = False):
+
+	# Yields the roots of the games in an SGF collection one at a time, reading the input in chunks,
+	# so memory use is bounded by the largest game rather than the whole file. The source can be a
+	# filename or a file object. As with load_sgf(), garbage after at least 1 game ends the iteration
+	# quietly, but if there's no game at all this throws. The modes are as for load_sgf().
+
+	if hasattr(source, "read"):
+		yield from _iter_sgf(source, chunk_size, headers_only, mainline_only, lazy)
+		return
+
+	# As with load(), compressed files are decompressed as they are read, and archives give the games
+	# of each member in turn (with GIB and NGF members loaded whole).
+
+	opener, archive = _sniff(source)
+
+	if archive:
+		count = 0
+		try:
+			for name, fileobj in _archive_members(source, archive):
+				if _strip_compression(name).lower().endswith((".gib", ".ngf")):
+					roots = _load_member(name, fileobj.read(), headers_only, mainline_only)
+				else:
+					roots = _iter_sgf(fileobj, chunk_size, headers_only, mainline_only, False)
+				try:
+					for root in roots:
+						count += 1
+						yield root
+				except ParserFail as err:
+					raise ParserFail("{}: {}".format(name, err)) from None
+		except _decompression_errors as err:
+			raise ParserFail("Archive load error: {}".format(err)) from None
+		if count == 0:
+			raise ParserFail("Archive load error: Found no game")
+	elif opener:
+		try:
+			with opener(source, "rb") as infile:
+				yield from _iter_sgf(infile, chunk_size, headers_only, mainline_only, False)
+		except _decompression_errors as err:
+			raise ParserFail("Decompression error: {}".format(err)) from None
+	else:
+		with open(source, "rb") as infile:
+			yield from _iter_sgf(infile, chunk_size, headers_only, mainline_only, lazy)
+
+
+def _iter_sgf(infile, chunk_size, headers_only, mainline_only, lazy):
+
+	parser = SGFFeedParser(headers_only, mainline_only, lazy)
+
+	while not parser.finished:
+		chunk = infile.read(chunk_size)
+		if not chunk:
+			break
+		if type(chunk) is str:
+			chunk = chunk.encode(encoding="utf-8", errors="replace")
+		yield from parser.feed(chunk)
+
+	yield from parser.close()
+
+
+async def iter_sgf_async(reader, chunk_size = 1 << 16, headers_only = False, mainline_only = False, lazy = False):
+
+	# As iter_sgf(), but an async generator reading from an asyncio.StreamReader (or anything with
+	# an async read method). Each chunk is scanned as it arrives and each game is parsed once its
+	# closing paren arrives, so the work done between yields to the event loop is bounded by the
+	# chunk size plus the size of any game completed by it.
+
+	import asyncio									# Not at the top, as it's slow to import and only needed here
+
+	parser = SGFFeedParser(headers_only, mainline_only, lazy)
+
+	while not parser.finished:
+		chunk = await reader.read(chunk_size)
+		if not chunk:
+			break
+		for root in parser.feed(chunk):
+			yield root
+		await asyncio.sleep(0)						# read() doesn't yield if data was already buffered
+
+	for root in parser.close():
+		yield root
+
+
+class SGFFeedParser:
+
+	# Push parser for SGF arriving in pieces, e.g. from a socket. feed() takes bytes and returns a
+	# list of the roots of any games completed by them; close() signals the end of input and returns
+	# the same (normally an empty list). As with load_sgf(), garbage after at least 1 game ends the
+	# parse quietly (after which finished is True and further input is ignored), but if there's no
+	# game at all this throws.
+	#
+	# Between feeds only the position of the end of the current game is tracked, by skipping
+	# everything except parens and values, with the state being the paren depth and whether the
+	# scan stopped inside a value, perhaps just after a backslash. A completed game is then parsed
+	# in one go, by the normal parser.
+	#
+	# Like load_sgf(), until a game is found the outcome depends on whether at least 3 bytes remain
+	# (fewer is simply "no game"), so with less than that buffered, decisions wait for more input.
+
+	def __init__(self, headers_only = False, mainline_only = False, lazy = False):
+		self.headers_only = headers_only
+		self.mainline_only = mainline_only
+		self.lazy = lazy
+		self.finished = False
+		self._buf = bytearray()
+		self._scan = 0						# How far the current game has been scanned
+		self._depth = 0						# Paren depth at _scan
+		self._in_value = False				# Whether _scan is inside a value...
+		self._escaped = False				# ...and just after a backslash
+		self._count = 0						# Games found so far
+
+
+	def feed(self, data):
+
+		if self.finished:
+			return []
+
+		buf = self._buf
+		buf += data
+		scan = self._scan
+		depth = self._depth
+		off = 0								# Start of the current game in buf
+		ret = []
+
+		with _GCPause():
+			while scan < len(buf):
+
+				if self._in_value:
+					if self._escaped:
+						scan += 1
+						self._escaped = False
+					scan = _sgf_value_body.match(buf, scan).end()
+					if scan >= len(buf):
+						break
+					scan += 1
+					if buf[scan - 1] == 92:					# A backslash at the very end of the input
+						self._escaped = True
+					else:
+						self._in_value = False
+					continue
+
+				if depth == 0:
+					scan = _sgf_whitespace.match(buf, scan).end()
+					if scan >= len(buf):
+						break
+					if buf[scan] != 40:						# Not a game
+						if self._count == 0 and len(buf) - off < 3:
+							break
+						self._leftovers(bytes(buf[off:]))
+						return ret
+					depth = 1
+					scan += 1
+					continue
+
+				scan = _sgf_skip.match(buf, scan).end()
+				if scan >= len(buf):
+					break
+				c = buf[scan]
+				scan += 1
+				if c == 91:									# [ of a value not all present yet
+					self._in_value = True
+				elif c == 40:
+					depth += 1
+				else:
+					depth -= 1
+					if depth == 0:
+						if self._count == 0 and len(buf) - off < 3:		# Just "()" so far
+							depth = 1
+							scan -= 1
+							break
+						root = self._parse(bytes(buf[off:scan]))
+						if not root:
+							return ret
+						ret.append(root)
+						off = scan
+
+		del buf[:off]
+		self._scan = scan - off
+		self._depth = depth
+		return ret
+
+
+	def close(self):
+
+		# Anything left is an incomplete game, or just whitespace.
+
+		if not self.finished:
+			self._leftovers(bytes(self._buf))
+		return []
+
+
+	def _parse(self, game):
+
+		try:
+			root = _load_sgf_game(game, 0, self.headers_only, self.mainline_only, self.lazy).root
+		except:
+			if self._count > 0:
+				self._stop()
+				return None
+			else:
+				raise
+		self._count += 1
+		return root
+
+
+	def _leftovers(self, rest):
+
+		# Called with whatever remains when no further game can be found. If there was no game at
+		# all, parsing it anyway gives the same error as load_sgf() would.
+
+		self._stop()
+		if self._count == 0:
+			if len(rest) >= 3:
+				_load_sgf_game(rest, 0, self.headers_only, self.mainline_only, self.lazy)
+			raise ParserFail("SGF load error: Found no game")
+
+
+	def _stop(self):
+		self.finished = True
+		self._buf = bytearray()
+
+
+class _GCPause:
+
+	# Building a big tree of Nodes makes the cyclic garbage collector run over and over while
+	# achieving nothing, since nothing is garbage yet. So loaders pause it for the duration.
+
+	def __enter__(self):
+		self.was_enabled = gc.isenabled()
+		gc.disable()
+
+	def __exit__(self, *args):
+		if self.was_enabled:
+			gc.enable()
+
+
+# The SGF tokenizer works a whole token at a time using these, rather than byte by byte...
+
+_sgf_whitespace = re.compile(rb"[\x00-\x20]*")
+_sgf_token = re.compile(rb"[\x00-\x20]*(?:([A-Za-z]+)|[^\x00-\x20])")				# A run of letters, or any other byte
+_sgf_escaped_value = re.compile(rb"(?:[^\\\]]+|\\.)*", re.DOTALL)					# Value up to the closing ]
+_sgf_escape = re.compile(rb"\\(.)", re.DOTALL)
+_sgf_lowercase = b"abcdefghijklmnopqrstuvwxyz"
+_sgf_keys = dict()																	# b"AB" --> "AB" (interned)
+_sgf_points = dict()																# b"dd" --> "dd"
+_sgf_lazy_length = 32																# Shortest value left undecoded by lazy loads
+_sgf_skip = re.compile(rb"[^()\[]*(?:\[[^\\\]]*(?:\\.[^\\\]]*)*\][^()\[]*)*", re.DOTALL)		# Up to a paren, or incomplete value
+_sgf_value_body = re.compile(rb"[^\\\]]*(?:\\.[^\\\]]*)*", re.DOTALL)									# Up to the ], or a final backslash
+
+# Fast path: a run of consecutive nodes whose properties have plain uppercase keys (i.e. nearly
+# every node) is matched in one go and then split into items. An item is either (b";", key, value,
+# b"", b"") for a new node, whose first property follows directly if key is not empty, or (b"", b"",
+# b"", key, value) for a further property value of that node, in which case key is b"" if the value
+# belongs to the same key as the previous value. Values are still escaped.
+#
+# Lazy loads use runs that stop at any long or escaped value, leaving it to the slow path, which
+# knows where the value is in the buffer.
+
+_sgf_node_run = re.compile(rb"(?:[\x00-\x20]*;(?:[\x00-\x20]*[A-Z]+(?:[\x00-\x20]*\[[^\\\]]*(?:\\.[^\\\]]*)*\])+)*)+", re.DOTALL)
+_sgf_node = re.compile(rb"[\x00-\x20]*;(?:[\x00-\x20]*[A-Z]+(?:[\x00-\x20]*\[[^\\\]]*(?:\\.[^\\\]]*)*\])+)*", re.DOTALL)		# Just 1 node
+_sgf_lazy_node_run = re.compile(rb"(?:[\x00-\x20]*;(?:[\x00-\x20]*[A-Z]+(?:[\x00-\x20]*\[[^\\\]]{0,%d}\])+)*)+" % (_sgf_lazy_length - 1))
+_sgf_lazy_node = re.compile(rb"[\x00-\x20]*;(?:[\x00-\x20]*[A-Z]+(?:[\x00-\x20]*\[[^\\\]]{0,%d}\])+)*" % (_sgf_lazy_length - 1))
+_sgf_node_run_items = re.compile(rb"(;)[\x00-\x20]*(?:([A-Z]+)[\x00-\x20]*\[([^\\\]]*(?:\\.[^\\\]]*)*)\])?|([A-Z]*)[\x00-\x20]*\[([^\\\]]*(?:\\.[^\\\]]*)*)\]", re.DOTALL)
+
+
+def _load_sgf_game(buf, off, headers_only = False, mainline_only = False, lazy = False):
+	return _sgf_parse_game(buf, off, _NodeBuilder(headers_only, lazy), headers_only, mainline_only)
+
+
+def _sgf_parse_game(buf, off, builder, headers_only = False, mainline_only = False):
+
+	# Parses one game starting at off, which buf must be bytes (or an mmap). Note that whitespace
+	# between key letters is ignored, as are lowercase letters (except that they start a new key
+	# after a value, e.g. in old-style "AddBlack").
+	#
+	# The nodes themselves are made by builder (a _NodeBuilder or a _PackedBuilder), so this is
+	# shared by load_sgf() and load_sgf_packed(). No node is represented by None. Runs of simple
+	# nodes are handed to the builder whole, since that's where nearly all the time goes.
+	#
+	# Subtrees don't recurse; instead the state of the enclosing tree is pushed onto a stack.
+
+	stack = []
+	parent_of_local_root = None
+	root = None
+	node = None
+	key = b""
+	keycomplete = False
+
+	i = _sgf_whitespace.match(buf, off).end()
+
+	if i >= len(buf):
+		raise ParserFail("SGF load error: Reached end of input")
+	if buf[i] != 40:										# (
+		raise ParserFail("SGF load error: Unexpected byte before (")
+
+	i += 1
+
+	while True:
+
+		m = _sgf_token.match(buf, i)
+
+		if not m:
+			raise ParserFail("SGF load error: Reached end of input")
+
+		i = m.end()
+		letters = m.group(1)
+
+		if letters:
+			if keycomplete:
+				key = b""
+				keycomplete = False
+			key += letters.translate(None, _sgf_lowercase)
+			continue
+
+		c = buf[i - 1]
+
+		if c == 91:											# [
+			if node is None:
+				node = builder.new_node(parent_of_local_root)
+				root = node
+			keycomplete = True
+			if len(key) == 0:
+				raise ParserFail("SGF load error: Value started by [ but key was empty")
+			if (key == b"B" or key == b"W") and builder.has_move(node):
+				raise ParserFail("Multiple moves in node")
+			end = buf.find(b"]", i)
+			if end == -1:
+				raise ParserFail("SGF load error: Reached end of input")
+			escaped = buf.find(b"\\", i, end) != -1
+			if escaped:										# The first ] may not be the end.
+				end = _sgf_escaped_value.match(buf, i).end()
+				if end >= len(buf) or buf[end] != 93:
+					raise ParserFail("SGF load error: Reached end of input")
+			builder.add_value(node, key, buf, i, end, escaped)
+			i = end + 1
+		elif c == 40:										# (
+			if node is None:
+				raise ParserFail("SGF load error: New subtree started but node was None")
+			if headers_only:
+				i = _sgf_skip_subtree(buf, i, 2)
+				return ParseResult(root = root, readcount = i - off)
+			if mainline_only and builder.has_children(node):
+				i = _sgf_skip_subtree(buf, i, 1)
+				continue
+			stack.append((parent_of_local_root, root, node, key, keycomplete))
+			parent_of_local_root = node
+			root = None
+			node = None
+			key = b""
+			keycomplete = False
+		elif c == 41:										# )
+			if root is None:
+				raise ParserFail("SGF load error: Subtree ended but local root was None")
+			if not stack:
+				return ParseResult(root = root, readcount = i - off)
+			parent_of_local_root, root, node, key, keycomplete = stack.pop()
+		elif c == 59:										# ;
+			if headers_only and node is not None:
+				i = _sgf_skip_subtree(buf, i, 1)
+				return ParseResult(root = root, readcount = i - off)
+			node, first, key, i = builder.add_run(buf, i - 1, node, parent_of_local_root)
+			if root is None:
+				root = first
+			keycomplete = key != b""					# The run ends with either a ; or a complete value.
+		else:
+			raise ParserFail("SGF load error: Unacceptable byte while expecting key")
+
+
+class _NodeBuilder:
+
+	# Makes Node objects for _sgf_parse_game().
+
+	def __init__(self, headers_only, lazy):
+
+		self.lazy = lazy
+
+		if lazy:
+			self.node_run = _sgf_lazy_node if headers_only else _sgf_lazy_node_run
+		else:
+			self.node_run = _sgf_node if headers_only else _sgf_node_run
+
+
+	def new_node(self, parent):
+		return Node(parent)
+
+
+	def has_move(self, node):
+		return "B" in node.props or "W" in node.props
+
+
+	def has_children(self, node):
+		return bool(node.children)
+
+
+	def add_value(self, node, key, buf, start, end, escaped):
+
+		keystring = _sgf_keys.get(key)
+		if not keystring:
+			keystring = sys.intern(key.decode(encoding="ascii"))
+			_sgf_keys[key] = keystring
+		if self.lazy and end - start >= _sgf_lazy_length:
+			node.add_value_fast(keystring, _LazyValue(buf, start, end))
+		else:
+			value = buf[start:end]
+			if escaped:
+				value = _sgf_escape.sub(rb"\1", value)
+			node.add_value_fast(keystring, value.decode(encoding="utf-8", errors="replace"))
+
+
+	def add_run(self, buf, i, node, parent_of_local_root):
+
+		# Adds the run of simple nodes starting with the ; at i, after node (or as a new local root
+		# if node is None). Returns the last node, the first if it's a new local root (else None),
+		# the last key, and where the run ends.
+
+		m = self.node_run.match(buf, i)
+		first = None
+		key = b""
+
+		for semicolon, k, value, k2, value2 in _sgf_node_run_items.findall(buf, i, m.end()):
+			if semicolon:
+				if node is not None:
+					node = Node(node)
+				else:
+					node = Node(parent_of_local_root)
+					first = node
+				key = k
+				if not k:
+					continue
+			else:
+				if k2:
+					key = k2
+				value = value2
+				if (key == b"B" or key == b"W") and ("B" in node.props or "W" in node.props):
+					raise ParserFail("Multiple moves in node")
+			keystring = _sgf_keys.get(key)
+			if not keystring:
+				keystring = sys.intern(key.decode("ascii"))
+				_sgf_keys[key] = keystring
+			if b"\\" in value:
+				value = _sgf_escape.sub(rb"\1", value)
+			if len(value) == 2:								# Nearly always a move, so share the string.
+				s = _sgf_points.get(value)
+				if not s:
+					s = value.decode("utf-8", "replace")
+					_sgf_points[value] = s
+				node.add_value_fast(keystring, s)
+			else:
+				node.add_value_fast(keystring, value.decode("utf-8", "replace"))
+
+		return node, first, key, m.end()
+
+
+class _LazyValue:
+
+	# A property value not yet decoded, i.e. where it is in the (escaped) source buffer.
+
+	__slots__ = ("buf", "start", "end")
+
+	def __init__(self, buf, start, end):
+		self.buf = buf
+		self.start = start
+		self.end = end
+
+	def decode(self):
+		return _sgf_value(self.buf, self.start, self.end)
+
+
+def _sgf_value(buf, start, end):
+
+	value = buf[start:end]
+	if b"\\" in value:
+		value = _sgf_escape.sub(rb"\1", value)
+	return value.decode("utf-8", "replace")
+
+
+def _sgf_skip_subtree(buf, i, depth):
+
+	# Returns the index just past the ) that takes the paren depth from the given value to 0,
+	# looking at nothing but parens and values on the way.
+
+	while True:
+		i = _sgf_skip.match(buf, i).end()
+		if i >= len(buf) or buf[i] == 91:					# [ that was never closed
+			raise ParserFail("SGF load error: Reached end of input")
+		depth += 1 if buf[i] == 40 else -1
+		i += 1
+		if depth == 0:
+			return i
+
+# -------------------------------------------------------------------------------------------------
+
+class PackedTree:
+
+	# A read-only collection of game trees, as parallel arrays indexed by node number instead of
+	# Node objects. Parents always come before their children. The arrays support the buffer
+	# protocol, so can be handed to e.g. numpy.frombuffer() for whole-collection work:
+	#
+	#   parent, first_child, next_sibling     node numbers, or -1
+	#   colour                                1 for a B move, 2 for a W move, else 0
+	#   move                                  x + y * 52 of that move, or -1 for a pass (or junk)
+	#   prop_start, prop_count                each node's properties, in the following:
+	#   prop_key                              index into keys, a list of key strings
+	#   value_start, value_end                where each (still escaped) value is in buf
+	#
+	# roots holds the node number of each game's root. Use load_sgf_packed() to make one.
+
+	def __init__(self, buf):
+
+		self.buf = buf
+		self.roots = array("i")
+		self.parent = array("i")
+		self.first_child = array("i")
+		self.next_sibling = array("i")
+		self.colour = array("b")
+		self.move = array("h")
+		self.prop_start = array("i")
+		self.prop_count = array("i")
+		self.prop_key = array("H")
+		self.value_start = array("q")
+		self.value_end = array("q")
+		self.keys = ["B", "W"]										# Always the first 2 keys
+		self._key_codes = {b"B": 0, b"W": 1}						# b"AB" --> index into keys
+
+
+	def __len__(self):
+		return len(self.parent)
+
+
+	def children(self, i):
+
+		ret = []
+		child = self.first_child[i]
+		while child != -1:
+			ret.append(child)
+			child = self.next_sibling[child]
+		return ret
+
+
+	def get(self, i, key):
+
+		key = str(key)
+
+		for j in range(self.prop_start[i], self.prop_start[i] + self.prop_count[i]):
+			if self.keys[self.prop_key[j]] == key:
+				return _sgf_value(self.buf, self.value_start[j], self.value_end[j])
+		return ""
+
+
+	def all_values(self, i, key):
+
+		key = str(key)
+
+		ret = []
+		for j in range(self.prop_start[i], self.prop_start[i] + self.prop_count[i]):
+			if self.keys[self.prop_key[j]] == key:
+				ret.append(_sgf_value(self.buf, self.value_start[j], self.value_end[j]))
+		return ret
+
+
+	def cursor(self, i = 0):
+		return PackedCursor(self, i)
+
+
+	def to_nodes(self):
+
+		# Returns a list of roots, as load_sgf() would.
+
+		buf = self.buf
+		keys = self.keys
+		nodes = [None] * len(self.parent)
+
+		with _GCPause():
+			for i, p in enumerate(self.parent):
+				node = Node(nodes[p] if p != -1 else None)
+				nodes[i] = node
+				start = self.prop_start[i]
+				for j in range(start, start + self.prop_count[i]):
+					node.add_value_fast(keys[self.prop_key[j]], _sgf_value(buf, self.value_start[j], self.value_end[j]))
+
+		return [nodes[i] for i in self.roots]
+
+
+	def _add_node(self, parent):
+
+		self.parent.append(parent)
+		self.colour.append(0)
+		self.move.append(-1)
+		self.prop_start.append(len(self.prop_key))
+		self.prop_count.append(0)
+		return len(self.parent) - 1
+
+
+	def _key_code(self, key):
+
+		code = self._key_codes.get(key)
+		if code is None:
+			code = len(self.keys)
+			self.keys.append(sys.intern(key.decode("ascii")))
+			self._key_codes[key] = code
+		return code
+
+
+	def _add_value(self, i, key, start, end):
+
+		code = self._key_code(key)
+
+		# A node's properties must be contiguous. Only in odd files (a property after a subtree)
+		# can they not be, in which case the ones so far are moved to the end.
+
+		if self.prop_start[i] + self.prop_count[i] != len(self.prop_key):
+			old = self.prop_start[i]
+			self.prop_start[i] = len(self.prop_key)
+			for j in range(old, old + self.prop_count[i]):
+				self.prop_key.append(self.prop_key[j])
+				self.value_start.append(self.value_start[j])
+				self.value_end.append(self.value_end[j])
+
+		self.prop_key.append(code)
+		self.value_start.append(start)
+		self.value_end.append(end)
+		self.prop_count[i] += 1
+
+		if code < 2:												# B or W
+			value = self.buf[start:end]
+			if b"\\" in value:
+				value = _sgf_escape.sub(rb"\1", value)
+			self.colour[i] = code + 1
+			self.move[i] = _sgf_point_codes.get(value, -1)
+
+
+	def _truncate(self, nodes, props):
+
+		for arr in (self.parent, self.colour, self.move, self.prop_start, self.prop_count):
+			del arr[nodes:]
+		for arr in (self.prop_key, self.value_start, self.value_end):
+			del arr[props:]
+
+
+	def _link(self):
+
+		# Builds first_child and next_sibling from parent, keeping children in file order.
+
+		n = len(self.parent)
+		first_child = array("i", [-1]) * n
+		next_sibling = array("i", [-1]) * n
+
+		for i in range(n - 1, -1, -1):
+			p = self.parent[i]
+			if p != -1:
+				next_sibling[i] = first_child[p]
+				first_child[p] = i
+
+		self.first_child = first_child
+		self.next_sibling = next_sibling
+
+
+class PackedCursor:
+
+	# Walks a PackedTree. The moving methods return False (not moving) if there's nowhere to go.
+
+	__slots__ = ("tree", "index")
+
+	def __init__(self, tree, index = 0):
+		self.tree = tree
+		self.index = index
+
+	def up(self):
+		p = self.tree.parent[self.index]
+		if p == -1:
+			return False
+		self.index = p
+		return True
+
+	def down(self, n = 0):
+		child = self.tree.first_child[self.index]
+		while n > 0 and child != -1:
+			child = self.tree.next_sibling[child]
+			n -= 1
+		if child == -1:
+			return False
+		self.index = child
+		return True
+
+	def next_sibling(self):
+		sibling = self.tree.next_sibling[self.index]
+		if sibling == -1:
+			return False
+		self.index = sibling
+		return True
+
+	def get(self, key):
+		return self.tree.get(self.index, key)
+
+	def all_values(self, key):
+		return self.tree.all_values(self.index, key)
+
+
+def load_sgf_packed(buf):
+
+	# Like load_sgf() but returns a PackedTree holding all the games. Values are not decoded, and
+	# no per-node objects are made at all, so the tree keeps buf alive.
+
+	if type(buf) is str:
+		buf = buf.encode(encoding="utf-8", errors="replace")
+	elif type(buf) is not bytes and type(buf) is not mmap.mmap:
+		buf = bytes(buf)
+
+	tree = PackedTree(buf)
+	off = 0
+
+	with _GCPause():
+		while len(buf) - off >= 3:
+			nodes = len(tree.parent)
+			props = len(tree.prop_key)
+			try:
+				o = _load_sgf_packed_game(buf, off, tree)
+				tree.roots.append(o.root)
+				off += o.readcount
+			except:
+				tree._truncate(nodes, props)
+				if len(tree.roots) > 0:
+					break
+				else:
+					raise
+
+	if len(tree.roots) == 0:
+		raise ParserFail("SGF load error: Found no game")
+
+	tree._link()
+	return tree
+
+
+def _load_sgf_packed_game(buf, off, tree):
+	return _sgf_parse_game(buf, off, _PackedBuilder(tree))
+
+
+class _PackedBuilder:
+
+	# Adds nodes to a PackedTree for _sgf_parse_game(). Nodes are numbers, with -1 for none in the
+	# tree itself.
+
+	def __init__(self, tree):
+		self.tree = tree
+
+
+	def new_node(self, parent):
+		return self.tree._add_node(-1 if parent is None else parent)
+
+
+	def has_move(self, node):
+		return self.tree.colour[node] != 0
+
+
+	def add_value(self, node, key, buf, start, end, escaped):
+		self.tree._add_value(node, key, start, end)
+
+
+	def add_run(self, buf, i, node, parent_of_local_root):
+
+		# As _NodeBuilder.add_run(), with tree._add_node() and tree._add_value() inlined, which is
+		# safe because here the node receiving values is always the newest, so its properties are
+		# at the end already.
+
+		tree = self.tree
+		key_codes = tree._key_codes
+		parent = tree.parent
+		colour = tree.colour
+		move = tree.move
+		prop_count = tree.prop_count
+		prop_key = tree.prop_key
+		parent_append = parent.append
+		colour_append = colour.append
+		move_append = move.append
+		prop_start_append = tree.prop_start.append
+		prop_count_append = prop_count.append
+		prop_key_append = prop_key.append
+		value_start_append = tree.value_start.append
+		value_end_append = tree.value_end.append
+
+		if node is None:
+			node = -1
+		if parent_of_local_root is None:
+			parent_of_local_root = -1
+
+		m = _sgf_node_run.match(buf, i)
+		pos = i
+		first = None
+		key = b""
+
+		for semicolon, k, value, k2, value2 in _sgf_node_run_items.findall(buf, i, m.end()):
+			if semicolon:
+				if node == -1:
+					first = len(parent)
+				parent_append(node if node != -1 else parent_of_local_root)
+				node = len(parent) - 1
+				colour_append(0)
+				move_append(-1)
+				prop_start_append(len(prop_key))
+				prop_count_append(0)
+				key = k
+				if not k:
+					continue
+				code = key_codes.get(key)
+			else:
+				if k2:
+					key = k2
+					code = key_codes.get(key)
+				value = value2
+				if code is not None and code < 2 and colour[node]:
+					raise ParserFail("Multiple moves in node")
+			if code is None:
+				code = tree._key_code(key)
+			start = buf.find(b"[", pos) + 1				# Nothing since the last value can contain a [
+			pos = start + len(value) + 1
+			prop_key_append(code)
+			value_start_append(start)
+			value_end_append(pos - 1)
+			prop_count[node] += 1
+			if code < 2:								# B or W
+				if b"\\" in value:
+					value = _sgf_escape.sub(rb"\1", value)
+				colour[node] = code + 1
+				move[node] = _sgf_point_codes.get(value, -1)
+
+		return node, first, key, m.end()
+
+
+# -------------------------------------------------------------------------------------------------
+# Binary cache format, for collections that would take too long to parse every time. The file is a
+# header, then each game as a self-contained blob, then an index of where the blobs start:
+#
+#   header      magic, version, flags (0), game count, index offset            (see _packed_header)
+#   blobs       one per game, as made by _encode_game()
+#   index       game count + 1 offsets, little-endian uint64
+#
+# A blob starts with a string table (varint count, then varint length + UTF-8 for each string), then
+# the board width and height as 1 byte each, then the nodes in preorder. Each node is a little-endian
+# uint16 word, holding:
+#
+#   bits 0-1    number of children: 0, 1, or 2 meaning a varint count follows the word
+#   bits 2-3    1 or 2 if the node's first property is a B or W move on the board, else 0
+#   bit 4       set if (other) properties follow
+#   bits 5-15   the move's point, as x + y * width
+#
+# So a plain move costs 2 bytes. Properties are a varint count, then for each a varint key (string
+# id) and a varint of (value count << 2 | kind), then the values: for kind 0 each is a varint
+# string id; for kind 1 each is a uint16 point, x * 52 + y; for kind 2 they are a bitset over the
+# board, in x + y * width order, used for setup stones when it's smaller and loses nothing.
+
+_packed_magic = b"GF2PACK\x00"
+_packed_version = 1
+_packed_header = struct.Struct("<8sIIQQ")
+_packed_point_strings = dict()								# (width, height) --> SGF string of each point
+
+
+def save_packed(filename, roots):
+
+	# Saves the games (given by any of their nodes) in the binary format. The result is not
+	# dependent on the Python version, unlike pickle.
+
+	with open(filename, "wb") as outfile:
+		outfile.write(bytes(_packed_header.size))
+		offsets = [_packed_header.size]
+		for root in roots:
+			blob = _encode_game(root.get_root())
+			outfile.write(blob)
+			offsets.append(offsets[-1] + len(blob))
+		outfile.write(struct.pack("<{}Q".format(len(offsets)), *offsets))
+		outfile.seek(0)
+		outfile.write(_packed_header.pack(_packed_magic, _packed_version, 0, len(offsets) - 1, offsets[-1]))
+
+
+def load_packed(filename):
+
+	# Returns a PackedGames for a file written by save_packed().
+
+	return PackedGames(filename)
+
+
+class PackedGames:
+
+	# The games in a file written by save_packed(). The file is mapped into memory, and each game is
+	# only read and decoded (into a new tree of Nodes) when fetched by index or iterated over.
+	# Slicing returns a list, and is the quick way to decode many games, e.g. games[:] for all.
+
+	def __init__(self, filename):
+
+		with open(filename, "rb") as infile:
+			try:
+				self._mm = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+			except (OSError, ValueError):
+				raise ParserFail("Packed load error: Could not map file") from None
+
+		if len(self._mm) < _packed_header.size:
+			self.close()
+			raise ParserFail("Packed load error: File too short")
+
+		magic, version, flags, count, index = _packed_header.unpack_from(self._mm, 0)
+
+		if magic != _packed_magic:
+			self.close()
+			raise ParserFail("Packed load error: Not a packed gofish2 file")
+		if version != _packed_version:
+			self.close()
+			raise ParserFail("Packed load error: Unsupported version {}".format(version))
+		if index + (count + 1) * 8 > len(self._mm):
+			self.close()
+			raise ParserFail("Packed load error: File truncated")
+
+		self._count = count
+		self._index = index
+
+
+	def __len__(self):
+		return self._count
+
+
+	def __getitem__(self, i):
+
+		if isinstance(i, slice):
+			with _GCPause():
+				return [self._decode(j) for j in range(*i.indices(self._count))]
+
+		if i < 0:
+			i += self._count
+		if i < 0 or i >= self._count:
+			raise IndexError("game index out of range")
+
+		with _GCPause():
+			return self._decode(i)
+
+
+	def _decode(self, i):
+
+		start, end = struct.unpack_from("<2Q", self._mm, self._index + i * 8)
+
+		try:
+			return _decode_game(self._mm[start:end])
+		except (IndexError, UnicodeDecodeError):
+			raise ParserFail("Packed load error: Game {} is corrupt".format(i)) from None
+
+
+	def __iter__(self):
+		for i in range(self._count):
+			yield self[i]
+
+
+	def close(self):
+		self._mm.close()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *args):
+		self.close()
+
+
+def _put_varint(out, n):
+	while n >= 128:
+		out.append(n & 127 | 128)
+		n >>= 7
+	out.append(n)
+
+
+def _get_varint(b, pos):
+
+	# Returns the value and the position after it.
+
+	n = 0
+	shift = 0
+	while True:
+		c = b[pos]
+		pos += 1
+		n |= (c & 127) << shift
+		if c < 128:
+			return n, pos
+		shift += 7
+
+
+def _encode_game(root):
+
+	width = max(root.width, 0)
+	height = max(root.height, 0)
+	strings = dict()										# string --> id
+	body = bytearray()
+	body += bytes((width, height))
+	todo = [root]
+
+	while todo:
+
+		node = todo.pop()
+		children = node.children
+		items = list(node.props.items())
+
+		word = min(len(children), 2)
+
+		if items:
+			key, value = items[0]
+			if (key == "B" or key == "W") and type(value) is str:
+				xy = _s_to_xy_table.get(value)
+				if xy and xy[0] < width and xy[1] < height and xy[0] + xy[1] * width < 2048:
+					word |= (4 if key == "B" else 8) | (xy[0] + xy[1] * width) << 5
+					items = items[1:]
+			if items:
+				word |= 16
+
+		body.append(word & 255)
+		body.append(word >> 8)
+
+		if len(children) > 1:
+			_put_varint(body, len(children))
+
+		if items:
+			_put_varint(body, len(items))
+			for key, value in items:
+				_put_varint(body, strings.setdefault(key, len(strings)))
+				if type(value) is not list:
+					value = [value]
+				values = [v.decode() if type(v) is _LazyValue else v for v in value]
+				_encode_values(body, values, strings, width, height)
+
+		todo.extend(reversed(children))
+
+	out = bytearray()
+	_put_varint(out, len(strings))
+	for s in strings:										# In id order, since dicts are ordered
+		b = s.encode("utf-8", "surrogatepass")
+		_put_varint(out, len(b))
+		out += b
+
+	return bytes(out + body)
+
+
+def _encode_values(body, values, strings, width, height):
+
+	points = [_s_to_xy_table.get(v) for v in values]
+
+	if values and None not in points:
+
+		indices = [x + y * width for x, y in points]
+		bitset_size = (width * height + 7) // 8
+
+		if bitset_size < len(values) * 2 \
+				and all(x < width and y < height for x, y in points) \
+				and all(a < b for a, b in zip(indices, indices[1:])):
+			_put_varint(body, len(values) << 2 | 2)
+			bits = bytearray(bitset_size)
+			for i in indices:
+				bits[i >> 3] |= 1 << (i & 7)
+			body += bits
+		else:
+			_put_varint(body, len(values) << 2 | 1)
+			for x, y in points:
+				code = x * 52 + y
+				body.append(code & 255)
+				body.append(code >> 8)
+
+	else:
+
+		_put_varint(body, len(values) << 2)
+		for v in values:
+			_put_varint(body, strings.setdefault(v, len(strings)))
+
+
+def _decode_game(b):
+
+	# Returns the root of the game in the blob, which must be bytes.
+
+	n, pos = _get_varint(b, 0)
+	strings = []
+	for _ in range(n):
+		length, pos = _get_varint(b, pos)
+		strings.append(b[pos:pos + length].decode("utf-8", "surrogatepass"))
+		pos += length
+
+	width = b[pos]
+	height = b[pos + 1]
+	pos += 2
+
+	point_strings = _packed_point_strings.get((width, height))
+	if not point_strings:
+		point_strings = [_xy_to_s_table[(p % width) * 52 + p // width] for p in range(width * height)]
+		_packed_point_strings[(width, height)] = point_strings
+
+	root = None
+	parent = None
+	stack = []												# [node, children still to come] for branch points
+	new_node = Node.__new__
+
+	while True:
+
+		word = b[pos] | b[pos + 1] << 8
+		pos += 2
+
+		if word & 3 == 2:
+			child_count, pos = _get_varint(b, pos)
+
+		node = new_node(Node)								# Node(parent), without the call overhead
+		node.parent = parent
+		node.children = []
+		node.props = dict()
+		node._board = None
+		node._delta = None
+		if parent:
+			parent.children.append(node)
+		else:
+			root = node
+
+		if word & 12:
+			node.props["B" if word & 4 else "W"] = point_strings[word >> 5]
+
+		if word & 16:
+			n, pos = _get_varint(b, pos)
+			for _ in range(n):
+				k, pos = _get_varint(b, pos)
+				header, pos = _get_varint(b, pos)
+				key = sys.intern(strings[k])
+				count = header >> 2
+				kind = header & 3
+				if count == 0:
+					node.props[key] = []
+				elif kind == 0:
+					for _ in range(count):
+						k, pos = _get_varint(b, pos)
+						node.add_value_fast(key, strings[k])
+				elif kind == 1:
+					for _ in range(count):
+						node.add_value_fast(key, _xy_to_s_table[b[pos] | b[pos + 1] << 8])
+						pos += 2
+				else:
+					for j in range((width * height + 7) // 8):
+						c = b[pos + j]
+						while c:
+							low = c & -c
+							node.add_value_fast(key, point_strings[j * 8 + low.bit_length() - 1])
+							c ^= low
+					pos += (width * height + 7) // 8
+
+		if word & 3 == 1:
+			parent = node
+		elif word & 3 == 2:
+			parent = node
+			stack.append([node, child_count - 1])
+		elif stack:
+			top = stack[-1]
+			parent = top[0]
+			top[1] -= 1
+			if top[1] == 0:
+				stack.pop()
+		else:
+			return root
+
+
+# -------------------------------------------------------------------------------------------------
+# Parallel loading of many files. Each worker process loads a chunk of files and sends the games
+# back in the packed blob form (see above), which is far smaller and quicker to transfer than a
+# pickled tree of Nodes. The blobs are only decoded into Nodes when the caller asks for them.
+
+_load_many_extensions = _load_extensions + tuple(_compression_openers) + (".zip",) + _tar_extensions
+
+
+class LoadResult:
+
+	# One file's outcome from load_many(). If the file failed, error is the exception (usually a
+	# ParserFail) and there are no roots; otherwise error is None.
+
+	def __init__(self, path, blobs, error):
+		self.path = path
+		self.blobs = blobs
+		self.error = error
+		self._roots = None
+
+	@property
+	def roots(self):
+		if self._roots is None:
+			if self.error:
+				raise self.error
+			with _GCPause():
+				self._roots = [_decode_game(blob) for blob in self.blobs]
+		return self._roots
+
+
+def load_many(paths, workers = None, ordered = True, chunk_size = 16, headers_only = False, mainline_only = False):
+
+	# Yields a LoadResult for every file, loading them with load() across a pool of worker processes
+	# (by default one per core). Directories in paths are searched for .sgf, .gib and .ngf files, and
+	# for compressed files and archives, which load() also handles.
+	# A file that fails to load doesn't stop the batch; its LoadResult holds the error instead.
+	# If ordered is False, results come in whatever order they finish.
+
+	yield from _pool_map(_load_chunk, _expand_paths(paths), workers, ordered, chunk_size, headers_only, mainline_only)
+
+
+def _pool_map(func, items, workers, ordered, chunk_size, *args):
+
+	# Yields everything in the lists returned by func(chunk, *args) for chunks of the items, with the
+	# calls spread over a pool of processes (in this process if workers is 1).
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+
+	chunks = (items[i:i + chunk_size] for i in range(0, len(items), chunk_size))
+
+	if workers <= 1:
+		for chunk in chunks:
+			yield from func(chunk, *args)
+		return
+
+	# Only a few chunks per worker are kept in flight, so a huge list of paths doesn't mean a huge
+	# backlog of finished results waiting in memory.
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+
+		pending = []
+		for chunk in chunks:
+			pending.append(executor.submit(func, chunk, *args))
+			if len(pending) >= workers * 4:
+				if ordered:
+					yield from pending.pop(0).result()
+				else:
+					done, _ = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+					for future in done:
+						pending.remove(future)
+						yield from future.result()
+
+		if ordered:
+			for future in pending:
+				yield from future.result()
+		else:
+			for future in concurrent.futures.as_completed(pending):
+				yield from future.result()
+
+
+def _expand_paths(paths):
+
+	if isinstance(paths, (str, bytes, os.PathLike)):
+		paths = [paths]
+
+	ret = []
+	for path in paths:
+		if os.path.isdir(path):
+			for dirpath, dirnames, filenames in os.walk(path):
+				dirnames.sort()
+				ret.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(_load_many_extensions))
+		else:
+			ret.append(path)
+	return ret
+
+
+def _load_chunk(paths, headers_only, mainline_only):
+
+	# Runs in the worker. The errors are returned rather than raised, so the rest of the chunk still
+	# gets loaded. Anything other than a ParserFail or OSError is a bug somewhere, but still shouldn't
+	# kill a batch of thousands of files, so it is reported as a ParserFail.
 
-		return dyer[20] + dyer[40] + dyer[60] + dyer[31] + dyer[51] + dyer[71]
+	results = []
+	for path in paths:
+		try:
+			blobs = [_encode_game(root) for root in load(os.fspath(path), headers_only, mainline_only)]
+		except (ParserFail, OSError) as err:
+			results.append(LoadResult(path, None, err))
+		except Exception as err:
+			results.append(LoadResult(path, None, ParserFail("{}: {}".format(type(err).__name__, err))))
+		else:
+			results.append(LoadResult(path, blobs, None))
+	return results
 
 
-	def validated_move_string(self, s):
+# -------------------------------------------------------------------------------------------------
+# A persistent index of a corpus, in an SQLite database, so that duplicate checks and lookups by
+# player or date don't mean parsing everything. Each game is recorded as a file and its number
+# within that file (which for a packed file is its index, so it can be fetched directly).
 
-		# Returns s if s is an on-board SGF string, otherwise returns ""
+_index_schema = """
+	CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, error TEXT);
+	CREATE TABLE IF NOT EXISTS games (path TEXT, number INTEGER, dyer TEXT, pb TEXT, pw TEXT, dt TEXT, re TEXT,
+		PRIMARY KEY (path, number));
+	CREATE INDEX IF NOT EXISTS games_dyer ON games (dyer);
+	CREATE INDEX IF NOT EXISTS games_pb ON games (pb);
+	CREATE INDEX IF NOT EXISTS games_pw ON games (pw);
+	CREATE INDEX IF NOT EXISTS games_dt ON games (dt);
+"""
 
-		if not isinstance(s, str):
-			return ""
+_index_unknown_dyer = "??" * 6
 
-		if len(s) != 2:
-			return ""
 
-		x_ascii = ord(s[0])
-		y_ascii = ord(s[1])
+class CorpusIndex:
 
-		if x_ascii >= 97 and x_ascii <= 122:
-			x = x_ascii - 97
-		elif x_ascii >= 65 and x_ascii <= 90:
-			x = x_ascii - 65 + 26
-		else:
-			return ""
+	# Opens (or creates) the index in the given database file. Call update() to add files to it.
 
-		if y_ascii >= 97 and y_ascii <= 122:
-			y = y_ascii - 97
-		elif y_ascii >= 65 and y_ascii <= 90:
-			y = y_ascii - 65 + 26
-		else:
-			return ""
+	def __init__(self, filename):
+		self._db = sqlite3.connect(filename)
+		self._db.executescript(_index_schema)
 
-		if x >= 0 and x < self.width and y >= 0 and y < self.height:
-			return s
-		else:
-			return ""
 
+	def update(self, paths, workers = None, chunk_size = 16):
 
-	def subtree_size(self):			# Including self
+		# Indexes the files (and the files in any directories) given, skipping those already indexed
+		# and unchanged since. Packed files (from save_packed) can be given by name. Returns the number
+		# of files (re)indexed. Files that fail to load are remembered as such; see errors().
 
-		node = self
-		n = 0
+		known = dict()
+		for path, mtime, size in self._db.execute("SELECT path, mtime, size FROM files"):
+			known[path] = (mtime, size)
 
-		while True:
+		todo = []
+		for path in _expand_paths(paths):
+			path = os.path.abspath(path)
+			try:
+				st = os.stat(path)
+			except OSError:
+				continue
+			if known.get(path) != (st.st_mtime_ns, st.st_size):
+				todo.append(path)
+				known[path] = (st.st_mtime_ns, st.st_size)				# Also dedups todo
 
-			n += 1
+		count = 0
+		with self._db:
+			for path, mtime, size, error, rows in _pool_map(_index_chunk, todo, workers, False, chunk_size):
+				self._db.execute("DELETE FROM games WHERE path = ?", (path,))
+				self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, mtime, size, error))
+				self._db.executemany("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?)", ((path,) + row for row in rows))
+				count += 1
+		return count
 
-			if len(node.children) == 0:
-				return n
-			elif len(node.children) == 1:
-				node = node.children[0]
-			else:
-				for child in node.children:
-					n += child.subtree_size()
-				return n
 
+	def prune(self):
 
-	def tree_size(self):
-		return self.get_root().subtree_size()
+		# Removes files that no longer exist from the index, returning how many there were.
 
+		gone = [path for path, in self._db.execute("SELECT path FROM files") if not os.path.exists(path)]
+		with self._db:
+			for path in gone:
+				self._db.execute("DELETE FROM games WHERE path = ?", (path,))
+				self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+		return len(gone)
 
-	def make_move(self, s):			# This method cannot be used for passing
 
-		self._cache_board()
+	def find(self, dyer = None, player = None, pb = None, pw = None, result = None, date_from = None, date_to = None):
 
-		if not self._board.legal_move(s):
-			raise IllegalMove
+		# Returns a list of CorpusEntry for the games matching all the conditions given. Player
+		# matches either PB or PW, and result matches RE. Dates are compared as strings, so ISO dates (as used by DT) work,
+		# and date_to is inclusive of anything starting with it, e.g. "2019" covers all of 2019.
 
-		colourkey = self._board.active.upper()
+		conditions = []
+		params = []
+		for column, value in (("dyer", dyer), ("pb", pb), ("pw", pw), ("re", result)):
+			if value is not None:
+				conditions.append(column + " = ?")
+				params.append(value)
+		if player is not None:
+			conditions.append("(pb = ? OR pw = ?)")
+			params += [player, player]
+		if date_from is not None:
+			conditions.append("dt >= ?")
+			params.append(date_from)
+		if date_to is not None:
+			conditions.append("dt < ?")
+			params.append(date_to + "\uffff")
 
-		for node in self.children:
-			if node.get(colourkey) == s:
-				return node
+		sql = "SELECT * FROM games"
+		if conditions:
+			sql += " WHERE " + " AND ".join(conditions)
+		return [CorpusEntry(*row) for row in self._db.execute(sql + " ORDER BY path, number", params)]
 
-		node = Node(self)
-		node.set(colourkey, s)
 
-		return node
+	def duplicates(self):
 
+		# Returns a list of lists of CorpusEntry, one list for each Dyer signature shared by more than
+		# 1 game. Games too short to have any of the signature's moves are not considered.
 
-	def make_pass(self):
+		ret = []
+		current = None
+		for row in self._db.execute("""SELECT * FROM games WHERE dyer IN
+				(SELECT dyer FROM games WHERE dyer != ? GROUP BY dyer HAVING COUNT(*) > 1)
+				ORDER BY dyer, path, number""", (_index_unknown_dyer,)):
+			entry = CorpusEntry(*row)
+			if not current or current[0].dyer != entry.dyer:
+				current = []
+				ret.append(current)
+			current.append(entry)
+		return ret
 
-		self._cache_board()
-		colourkey = self._board.active.upper()
 
-		for node in self.children:
-			if node.has_key(colourkey):
-				if self.validated_move_string(node.get(colourkey)) == "":
-					return node
+	def errors(self):
 
-		node = Node(self)
-		node.set(colourkey, "")
+		# Returns a list of (path, error message) for indexed files that failed to load.
 
-		return node
+		return self._db.execute("SELECT path, error FROM files WHERE error IS NOT NULL ORDER BY path").fetchall()
 
 
-	def _mutor_check(self, key):	# With board caches, these properties require a recursive cache clear
+	def __len__(self):
+		return self._db.execute("SELECT COUNT(*) FROM games").fetchone()[0]
 
-		if key in ["B", "W", "AB", "AW", "AE", "PL", "SZ"]:
-			self._clear_board_recursive()
 
+	def close(self):
+		self._db.close()
 
-	def _clear_board_recursive(self):
 
-		node = self
+	def __enter__(self):
+		return self
 
-		while True:
 
-			node._board = None
+	def __exit__(self, *args):
+		self.close()
 
-			if len(node.children) == 0:
-				break
-			elif len(node.children) == 1:
-				node = node.children[0]
+
+class CorpusEntry:
+
+	def __init__(self, path, number, dyer, pb, pw, dt, result):
+		self.path = path
+		self.number = number
+		self.dyer = dyer
+		self.pb = pb
+		self.pw = pw
+		self.dt = dt
+		self.re = result
+
+	def __repr__(self):
+		return "CorpusEntry({!r}, {})".format(self.path, self.number)
+
+	def load(self):
+
+		# Returns the root of the game, parsing (or decoding) only its file (or blob).
+
+		if _is_packed(self.path):
+			with PackedGames(self.path) as games:
+				return games[self.number]
+		return load(self.path)[self.number]
+
+
+def _is_packed(path):
+	with open(path, "rb") as infile:
+		return infile.read(len(_packed_magic)) == _packed_magic
+
+
+def _index_chunk(paths):
+
+	# Runs in the worker. Returns (path, mtime, size, error, rows) for each file.
+
+	results = []
+	for path in paths:
+		rows = []
+		error = None
+		try:
+			st = os.stat(path)
+		except OSError:									# Gone since update() looked
+			continue
+		try:
+			if _is_packed(path):
+				with PackedGames(path) as games:
+					roots = games[:]
 			else:
-				for child in node.children:
-					child._clear_board_recursive()
-				break
+				roots = load(path, mainline_only = True)
+			for number, root in enumerate(roots):
+				rows.append((number, root.dyer(), root.get("PB"), root.get("PW"), root.get("DT"), root.get("RE")))
+		except Exception as err:
+			error = "{}: {}".format(type(err).__name__, err)
+			rows = []
+		results.append((path, st.st_mtime_ns, st.st_size, error, rows))
+	return results
+
 
 # -------------------------------------------------------------------------------------------------
+# Position index: the position_hash() (or canonical_hash()) of every position in the main line of
+# every game in a collection, so that the games reaching a position can be found without replaying
+# anything. The file is a header then fixed-size records (hash, game number, ply) sorted by hash, so
+# lookups are a binary search of the mapped file. A game's number is its place in the roots given,
+# e.g. its index in a packed file; ply 0 is the root. A position that persists across nodes (e.g.
+# a node with only a comment) is recorded at the first ply only. Stone hashes don't depend on the
+# board size, so the indexed hashes also include a key for it, lest e.g. an empty 19x19 board match
+# the start of every 9x9 game.
+
+_posindex_magic = b"GF2POSX\x00"
+_posindex_version = 2
+_posindex_header = struct.Struct("<8sIIQ")						# magic, version, flags, record count
+_posindex_record = struct.Struct("<QIH")
+_posindex_symmetries = 1										# Flag: hashes are canonical_hash()
+_posindex_run_length = 1 << 21									# Records sorted in memory at a time
+
+
+def save_position_index(filename, roots, symmetries = False):
+
+	# Builds the index for the games (given by their roots, which can be any iterable, e.g. a
+	# PackedGames or iter_sgf()). With symmetries, rotated and reflected positions are the same.
+	# Large collections are sorted in runs spilled to temporary files, which are then merged.
+
+	records = []
+	runs = []
+	count = 0
+
+	for game, root in enumerate(roots):
+		for h, ply in _game_position_hashes(root, symmetries):
+			records.append((h, game, ply))
+		if len(records) >= _posindex_run_length:
+			records.sort()
+			runs.append(_spill_run(records))
+			count += len(records)
+			records = []
+
+	records.sort()
+	count += len(records)
+
+	with open(filename, "wb") as outfile:
+		outfile.write(_posindex_header.pack(_posindex_magic, _posindex_version, _posindex_symmetries if symmetries else 0, count))
+		if runs:
+			merged = heapq.merge(records, *(_read_run(f) for f in runs))
+		else:
+			merged = records
+		pack = _posindex_record.pack
+		parts = []
+		for record in merged:
+			parts.append(pack(*record))
+			if len(parts) >= 8192:
+				outfile.write(b"".join(parts))
+				parts = []
+		outfile.write(b"".join(parts))
+
+	for f in runs:
+		f.close()
+
+
+def _game_position_hashes(root, symmetries):
+
+	# Yields (hash, ply) for each new position along the main line. With symmetries, the hashes of
+	# all the transformed boards are updated from the board's journal of changed points.
+
+	board = Board(root.width, root.height)
+	buf = board._buf
+	size_key = board._geo.zobrist_size
+	tables = _symmetries(board.width, board.height) if symmetries else None
+	hashes = [0] * len(tables) if tables else None
+	last = None
+	node = root
+	ply = 0
+
+	while ply <= 0xFFFF:
+
+		if tables:
+			board._journal = []
+			node.apply(board)
+			journal = board._journal
+			olds = dict()
+			for i in range(0, len(journal), 2):
+				olds.setdefault(journal[i], journal[i + 1])
+			for p, old in olds.items():
+				new = buf[p]
+				if new != old:
+					for i, keys in enumerate(tables):
+						hashes[i] ^= keys[old][p] ^ keys[new][p]
+			h = min(hashes)
+		else:
+			node.apply(board)
+			h = board._hash
 
-def s_to_xy(s):						# "cc" --> 2,2
+		if h != last:
+			yield h ^ size_key, ply
+			last = h
 
-	if not isinstance(s, str):
-		raise TypeError
+		if not node.children:
+			break
+		node = node.children[0]
+		ply += 1
 
-	if len(s) != 2:
-		raise ValueError
 
-	x_ascii = ord(s[0])
-	y_ascii = ord(s[1])
+def _spill_run(records):
+	f = tempfile.TemporaryFile()
+	pack = _posindex_record.pack
+	for i in range(0, len(records), 8192):
+		f.write(b"".join(pack(*record) for record in records[i:i + 8192]))
+	f.seek(0)
+	return f
 
-	if x_ascii >= 97 and x_ascii <= 122:
-		x = x_ascii - 97
-	elif x_ascii >= 65 and x_ascii <= 90:
-		x = x_ascii - 65 + 26
-	else:
-		raise ValueError
 
-	if y_ascii >= 97 and y_ascii <= 122:
-		y = y_ascii - 97
-	elif y_ascii >= 65 and y_ascii <= 90:
-		y = y_ascii - 65 + 26
-	else:
-		raise ValueError
+def _read_run(f):
+	size = _posindex_record.size
+	while True:
+		chunk = f.read(size * 8192)
+		if not chunk:
+			return
+		yield from _posindex_record.iter_unpack(chunk)
 
-	return (x, y)
 
+def load_position_index(filename):
 
-def xy_to_s(x, y):					# 2,2 --> "cc"
+	# Returns a PositionIndex for a file written by save_position_index().
 
-	if x < 0 or x >= 52 or y < 0 or y >= 52:
-		raise ValueError
+	return PositionIndex(filename)
 
-	s = ""
 
-	if x < 26:
-		s += chr(x + 97)
-	else:
-		s += chr(x + 65 - 26)
+class PositionIndex:
 
-	if y < 26:
-		s += chr(y + 97)
-	else:
-		s += chr(y + 65 - 26)
+	def __init__(self, filename):
 
-	return s
+		with open(filename, "rb") as infile:
+			try:
+				self._mm = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+			except (OSError, ValueError):
+				raise ParserFail("Position index load error: Could not map file") from None
 
+		if len(self._mm) < _posindex_header.size:
+			self.close()
+			raise ParserFail("Position index load error: File too short")
 
-def english_to_xy(e, height = 19, i_adjust = True):		# "Q16"     --->    15,3
+		magic, version, flags, count = _posindex_header.unpack_from(self._mm, 0)
 
-	if not isinstance(e, str):
-		raise TypeError
+		if magic != _posindex_magic:
+			self.close()
+			raise ParserFail("Position index load error: Not a position index")
+		if version != _posindex_version:
+			self.close()
+			raise ParserFail("Position index load error: Unsupported version {}".format(version))
+		if _posindex_header.size + count * _posindex_record.size > len(self._mm):
+			self.close()
+			raise ParserFail("Position index load error: File truncated")
 
-	if len(e) != 2 and len(e) != 3:
-		raise ValueError
+		self.symmetries = bool(flags & _posindex_symmetries)
+		self._count = count
 
-	e = e.upper()
 
-	if e[0] not in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
-		raise ValueError
+	def __len__(self):
+		return self._count
 
-	x = ord(e[0]) - 65
 
-	if i_adjust:
-		if e[0] == "I":
-			raise ValueError
-		if x > 7:
-			x -= 1
+	def find_position(self, board):
 
-	try:
-		y = height - int(e[1:])
-	except:
-		raise ValueError
+		# Returns a list of (game, ply) for every game that reached the board's stones (in some
+		# orientation, if the index was built with symmetries), in order of game.
 
-	if y < 0 or y >= height:
-		raise ValueError
+		return self.find_hash(board.canonical_hash() if self.symmetries else board.position_hash(), board.width, board.height)
 
-	return (x, y)
 
+	def find_hash(self, h, width, height):
 
-def safe_string(s):     			# "safe" meaning safely escaped \ and ] characters
-	s = s.replace("\\", "\\\\")
-	s = s.replace("]", "\\]")
-	return s
+		# As find_position(), given the position_hash() (or canonical_hash(), if the index was built
+		# with symmetries) of a width x height board.
 
+		h ^= _geometry(width, height).zobrist_size
 
-def handicap_stones(count, width, height, tygem = False):
+		mm = self._mm
+		unpack = _posindex_record.unpack_from
+		size = _posindex_record.size
+		base = _posindex_header.size
 
-	# From the Sabaki project by Yichuan Shen, with modifications.
-	# https://github.com/SabakiHQ/go-board
+		lo = 0
+		hi = self._count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if unpack(mm, base + mid * size)[0] < h:
+				lo = mid + 1
+			else:
+				hi = mid
 
-	if min(width, height) <= 6 or count < 2:
-		return []
+		ret = []
+		while lo < self._count:
+			record = unpack(mm, base + lo * size)
+			if record[0] != h:
+				break
+			ret.append(record[1:])
+			lo += 1
+		return ret
 
-	nearx = 3 if width >= 13 else 2
-	neary = 3 if height >= 13 else 2
-	farx = width - nearx - 1
-	fary = height - neary - 1
-	middlex = (width - 1) // 2
-	middley = (height - 1) // 2
 
-	if tygem:
-		stones = [[nearx, fary], [farx, neary], [nearx, neary], [farx, fary]]
-	else:
-		stones = [[nearx, fary], [farx, neary], [farx, fary], [nearx, neary]]
+	def close(self):
+		self._mm.close()
 
-	if width % 2 != 0 and height % 2 != 0 and (width >= 9 or height >= 9):
 
-		if count == 5 or count == 7 or count >= 9:
-			stones.append([middlex, middley])
+	def __enter__(self):
+		return self
 
-		stones += [
-			[nearx, middley],
-			[farx, middley],
-			[middlex, neary],
-			[middlex, fary]
+
+	def __exit__(self, *args):
+		self.close()
+
+
+# -------------------------------------------------------------------------------------------------
+# Pattern search. A pattern is a rectangle of cells given as strings, one per row, using:
+#
+#   X   black stone            O   white stone            .   empty point
+#   ?   any on-board point     #   off the board (whole outer rows or columns only)
+#
+# so "#" cells pin a pattern to an edge or corner. Each distinct rotation / reflection (and, unless
+# disabled, colour swap) of the pattern is turned into a regex over the board's padded buffer (see
+# _Geometry), with the rows of the pattern joined by skips to the next row of the board, so the
+# scanning is all done by the regex engine.
+#
+# A transform is 0-7 as for the symmetries (0 = as given, 1 = flipped left-right, 2 = flipped top-
+# bottom, 3 = rotated 180, 4-7 = transposed then as 0-3), plus 8 if the colours are swapped. The
+# location of a match is the x, y of the board point where the pattern's top-left cell landed; it
+# can be just off the board if that cell is a "#".
+
+_pattern_cells = {"X": b"\x01", "O": b"\x02", ".": b"\x00", "?": b"[\x00-\x02]", "#": b"\x03"}
+_pattern_swap = str.maketrans("XO", "OX")
+
+
+class Pattern:
+
+	def __init__(self, rows, colour_swap = True):
+
+		if isinstance(rows, str):
+			rows = rows.split()
+
+		self.rows = [str(row) for row in rows]
+		self.width = len(self.rows[0]) if self.rows else 0
+		self.height = len(self.rows)
+
+		if self.width == 0 or any(len(row) != self.width for row in self.rows):
+			raise ValueError("pattern rows must be non-empty and of equal length")
+		# The board's edge is only one point thick in the buffer, so off-board cells must form whole
+		# rows or columns along the outside of the pattern...
+
+		edge_rows = [y for y in (0, self.height - 1) if set(self.rows[y]) == {"#"}]
+		edge_columns = [x for x in (0, self.width - 1) if all(row[x] == "#" for row in self.rows)]
+
+		for y, row in enumerate(self.rows):
+			for x, c in enumerate(row):
+				if c not in _pattern_cells:
+					raise ValueError("bad pattern cell {!r}".format(c))
+				if c == "#" and y not in edge_rows and x not in edge_columns:
+					raise ValueError("off-board cells must form whole rows or columns on the outside of the pattern")
+		if all(c == "#" for row in self.rows for c in row):
+			raise ValueError("pattern has no on-board cells")
+
+		# variants is a list of (transform, rows, anchor x, anchor y), without duplicates...
+
+		self.variants = []
+		seen = set()
+		w = self.width
+		h = self.height
+
+		transforms = [
+			lambda x, y: (x, y),
+			lambda x, y: (w - 1 - x, y),
+			lambda x, y: (x, h - 1 - y),
+			lambda x, y: (w - 1 - x, h - 1 - y),
+			lambda x, y: (y, x),
+			lambda x, y: (h - 1 - y, x),
+			lambda x, y: (y, w - 1 - x),
+			lambda x, y: (h - 1 - y, w - 1 - x),
 		]
 
-	return [xy_to_s(z[0], z[1]) for z in stones[0:count]]
+		for swap in ((False, True) if colour_swap else (False,)):
+			for t, f in enumerate(transforms):
+				tw, th = (w, h) if t < 4 else (h, w)
+				grid = [[None] * tw for _ in range(th)]
+				for y, row in enumerate(self.rows):
+					for x, c in enumerate(row):
+						nx, ny = f(x, y)
+						grid[ny][nx] = c
+				variant = tuple("".join(row) for row in grid)
+				if swap:
+					variant = tuple(row.translate(_pattern_swap) for row in variant)
+				if variant not in seen:
+					seen.add(variant)
+					ax, ay = f(0, 0)
+					self.variants.append((t + 8 if swap else t, variant, ax, ay))
+
+		self._regexes = dict()								# stride --> list of (regex or None)
+
+
+	def _compiled(self, stride):
+
+		ret = self._regexes.get(stride)
+		if ret is None:
+			ret = []
+			for t, rows, ax, ay in self.variants:
+				gap = stride - len(rows[0])
+				if gap < 0:
+					ret.append(None)						# Can't fit
+					continue
+				body = (b".{%d}" % gap).join(b"".join(_pattern_cells[c] for c in row) for row in rows)
+				ret.append(re.compile(body, re.DOTALL))
+			self._regexes[stride] = ret
+		return ret
 
 
-def points_list(s):
+	def search(self, board):
 
-	if len(s) == 2:
-		return [s]
+		# Returns a list of (x, y, transform) for every match on the board.
 
-	if len(s) != 5 or s[2] != ":":
-		return []
+		ret = []
+		stride = board._geo.stride
+		buf = board._buf + b"\x03"							# The buffer lacks the bottom-right corner point
 
-	try:
-		x1, y1 = s_to_xy(s[0:2])
-		x2, y2 = s_to_xy(s[3:5])
-	except:
-		return []
+		for (t, rows, ax, ay), regex in zip(self.variants, self._compiled(stride)):
+			if regex:
+				m = regex.search(buf)
+				while m:
+					p = m.start()
+					ret.append((p % stride - 1 + ax, p // stride - 1 + ay, t))
+					m = regex.search(buf, p + 1)				# Matches can overlap
 
-	if x1 > x2:
-		x1, x2 = x2, x1
+		return ret
 
-	if y1 > y2:
-		y1, y2 = y2, y1
 
-	ret = []
+def search_games(pattern, roots):
 
-	for x in range(x1, x2 + 1):
-		for y in range(y1, y2 + 1):
-			try:
-				z = xy_to_s(x, y)
-			except:
-				continue
-			ret.append(z)
+	# Yields (game, ply, (x, y), transform) for matches in the main lines of the games, where game is
+	# the game's place in roots (which can be any iterable, as for save_position_index()) and ply 0 is
+	# the root. A match is reported at the ply it appears, not again for as long as it persists.
+
+	for game, root in enumerate(roots):
+
+		board = Board(root.width, root.height)
+		node = root
+		ply = 0
+		previous = set()
+
+		while True:
+			node.apply(board)
+			current = set(pattern.search(board))
+			for x, y, t in sorted(current - previous):
+				yield game, ply, (x, y), t
+			previous = current
+			if not node.children:
+				break
+			node = node.children[0]
+			ply += 1
 
-	return ret
 
 # -------------------------------------------------------------------------------------------------
+# Feature planes for machine learning, needing NumPy. The main line is replayed once on a single
+# Board, and each ply's planes are read off it through NumPy views of its buffer and chain tables.
+#
+# Plane names:
+#
+#   black, white, empty        the stones (or lack of them)
+#   own, opponent              the stones of the side to move, and of the other side
+#   black_to_move              all 1 if Black is to move
+#   ones                       all 1, which lets a network see the edge through zero padding
+#   ko                         the point illegal because of a simple ko
+#   liberties1 ... liberties4  stones in chains with exactly 1, 2 or 3 liberties, or 4 or more
+#   move1, move2, ...          the point of the move that led here, the one before that, etc
 
-def save(filename, node):
-	root = node.get_root()
-	with open(filename, "w", encoding="utf-8") as outfile:
-		_write_tree(outfile, root)
+_default_planes = ("black", "white", "black_to_move", "ko", "liberties1", "liberties2", "liberties3", "liberties4",
+	"move1", "move2", "move3", "move4")
 
 
-def _write_tree(outfile, node):
-	outfile.write("(")
-	while True:
-		outfile.write(";")
-		for key in node.props:
-			outfile.write(key)
-			for value in node.props[key]:
-				outfile.write("[{}]".format(safe_string(value)))
-		if len(node.children) > 1:
-			for child in node.children:
-				_write_tree(outfile, child)
-			break
-		elif len(node.children) == 1:
-			node = node.children[0]
-			continue
-		else:
-			break
-	outfile.write(")")
-	return
+def _require_numpy():
 
+	# NumPy is optional (only to_numpy() and game_to_planes() need it) and slow to import, so it's
+	# only imported when first needed. Returns the module.
 
-def load(filename):
+	try:
+		import numpy
+	except ImportError:
+		raise ImportError("NumPy is needed for this") from None
+	return numpy
 
-	# This can throw.
-	# Otherwise, returns a non-empty array of roots.
 
-	with open(filename, "rb") as infile:
-		buf = infile.read()
+def _numpy_view(buf, geo):
 
-	if filename.lower().endswith(".gib"):
-		return load_gib(buf)
-	elif filename.lower().endswith(".ngf"):
-		return load_ngf(buf)
-	else:
-		return load_sgf(buf)
+	# The board part of a padded buffer (see _Geometry) as a (height, width) array, sharing memory.
 
+	numpy = _require_numpy()
+	h = max(geo.height, 0)
+	return numpy.frombuffer(buf, dtype = numpy.uint8).reshape(h + 2, geo.stride)[1:h + 1, 1:]
 
-def load_sgf(buf):
 
-	# Always returns at least 1 game; or throws if it cannot.
+def game_to_planes(root, planes = _default_planes, out = None):
 
-	if type(buf) is str:
-		buf = bytearray(buf.encode(encoding="utf-8", errors="replace"))
+	# Returns a uint8 array of shape (plies, len(planes), height, width) for the positions along the
+	# main line from root, ply 0 being the root's. If out is given (an array with at least that many
+	# plies, and the right shape otherwise) the planes are written into it, and the part used is
+	# returned.
 
-	ret = []
-	off = 0
+	numpy = _require_numpy()
 
-	while len(buf) - off >= 3:
-		try:
-			o = _load_sgf_recursive(buf, off, None)
-			ret.append(o.root)
-			off += o.readcount
-		except:
-			if len(ret) > 0:
-				break
+	for name in planes:
+		if name not in _plane_names and not (name.startswith("move") and name[4:].isdigit() and int(name[4:]) > 0):
+			raise ValueError("unknown plane {!r}".format(name))
+
+	nodes = [root]
+	while nodes[-1].children:
+		nodes.append(nodes[-1].children[0])
+
+	board = Board(root.width, root.height)
+	geo = board._geo
+	w = max(board.width, 0)
+	h = max(board.height, 0)
+	shape = (len(nodes), len(planes), h, w)
+
+	if out is None:
+		out = numpy.zeros(shape, dtype = numpy.uint8)
+	else:
+		if out.shape[0] < shape[0] or out.shape[1:] != shape[1:]:
+			raise ValueError("out has shape {}, need {}".format(out.shape, shape))
+		out = out[:shape[0]]
+		out[...] = 0
+
+	grid = _numpy_view(board._buf, geo)
+	moves = []												# (x, y) or None for each ply's move
+	chain = None
+
+	for ply, node in enumerate(nodes):
+
+		node.apply(board)
+		board._ensure_chains()
+
+		move = None
+		for key in ("B", "W"):
+			if key in node.props:
+				p = geo.s_to_p.get(node.get(key))
+				if p:
+					move = (p % geo.stride - 1, p // geo.stride - 1)
+		moves.append(move)
+
+		if chain is not board._chain:						# Chain tables are only replaced by _apply_delta()
+			chain = board._chain
+			heads = numpy.frombuffer(chain, dtype = numpy.int16).reshape(h + 2, geo.stride)[1:h + 1, 1:]
+			nlibs = numpy.frombuffer(board._nlibs, dtype = numpy.int16)
+
+		libs = None
+		own = _colour_codes[board.active]
+		planes_out = out[ply]
+
+		for i, name in enumerate(planes):
+			if name == "black":
+				numpy.equal(grid, _BLACK, out = planes_out[i], casting = "unsafe")
+			elif name == "white":
+				numpy.equal(grid, _WHITE, out = planes_out[i], casting = "unsafe")
+			elif name == "empty":
+				numpy.equal(grid, _EMPTY, out = planes_out[i], casting = "unsafe")
+			elif name == "own":
+				numpy.equal(grid, own, out = planes_out[i], casting = "unsafe")
+			elif name == "opponent":
+				numpy.equal(grid, 3 - own, out = planes_out[i], casting = "unsafe")
+			elif name == "black_to_move":
+				planes_out[i] = board.active == "b"
+			elif name == "ones":
+				planes_out[i] = 1
+			elif name == "ko":
+				p = geo.s_to_p.get(board.ko) if board.ko else None
+				if p:
+					planes_out[i, p // geo.stride - 1, p % geo.stride - 1] = 1
+			elif name.startswith("liberties"):
+				if libs is None:
+					libs = nlibs[heads]						# Empty points have head 0, and _nlibs[0] is 0
+				n = int(name[9:])
+				if n < 4:
+					numpy.equal(libs, n, out = planes_out[i], casting = "unsafe")
+				else:
+					numpy.greater_equal(libs, 4, out = planes_out[i], casting = "unsafe")
 			else:
-				raise
+				back = int(name[4:])
+				if back <= len(moves) and moves[-back]:
+					x, y = moves[-back]
+					planes_out[i, y, x] = 1
 
-	if len(ret) == 0:
-		raise ParserFail("SGF load error: Found no game")
+	return out
 
-	return ret
 
+_plane_names = {"black", "white", "empty", "own", "opponent", "black_to_move", "ones", "ko",
+	"liberties1", "liberties2", "liberties3", "liberties4"}
 
-def _load_sgf_recursive(buf, off, parent_of_local_root):
 
-	root = None
-	node = None
-	tree_started = False
-	inside_value = False
-	escape_flag = False
+# -------------------------------------------------------------------------------------------------
+# Replaying games with just a Board, no Nodes and no cached boards, for when only the end result (or
+# the captures along the way) matters. The rules are those of Node.apply().
 
-	value = bytearray()
-	key = bytearray()
-	keycomplete = False
+def replay_moves(width, height, setup = None, moves = ()):
 
-	i = off - 1
-	while i + 1 < len(buf):
+	# Returns (board, captures) after playing the moves on a new Board, where captures[i] is how many
+	# stones move i captured (suicides included). setup, if given, is a dict of the root's setup
+	# properties "AB", "AW", "AE" (each a list of values, or a single value) and "PL". The moves are
+	# (colour, s) pairs with colour "b" or "w"; an s that isn't a point on the board is a pass.
 
-		i += 1
-		c = buf[i]
+	board = Board(width, height)
+	captures = []
 
-		if not tree_started:
-			if c <= 32:
-				continue
-			elif c == 40:								# (
-				tree_started = True
-				continue
-			else:
-				raise ParserFail("SGF load error: Unexpected byte before (")
+	if setup:
+		ab = _setup_values(setup.get("AB"))
+		aw = _setup_values(setup.get("AW"))
+		_apply_setup(board, _setup_values(setup.get("AE")), ab, aw)
+		if ab and not aw:
+			board.active = "w"
+		_apply_pl(board, setup.get("PL"))
 
-		if inside_value:
+	play = board.play_move_or_pass
 
-			if escape_flag:
-				value.append(buf[i])
-				escape_flag = False
-				continue
-			elif c == 92:								# \
-				escape_flag = True
-				continue
-			elif c == 93:								# ]
-				inside_value = False
-				if not node:
-					raise ParserFail("SGF load error: Value ended by ] but node was None")
-				node.add_value_fast(key.decode(encoding="utf-8", errors="replace"), value.decode(encoding="utf-8", errors="replace"))
-				continue
-			else:
-				value.append(c)
-				continue
+	for colour, s in moves:
+		before = board.caps_by_b + board.caps_by_w
+		play(s, colour)
+		captures.append(board.caps_by_b + board.caps_by_w - before)
 
-		else:
+	return board, captures
 
-			if c <= 32:								# whitespace
-				continue
-			elif c >= 97 and c <= 122:				# a-z
-				# Lowercase ASCII is normally discarded. If a property value has
-				# already completed, however, it marks the start of a new key.
-				if keycomplete:
-					key = bytearray()
-					keycomplete = False
-				continue
-			elif c == 91:								# [
-				if not node:
-					node = Node(parent_of_local_root)
-					root = node
-				value = bytearray()
-				inside_value = True
-				keycomplete = True
-				if len(key) == 0:
-					raise ParserFail("SGF load error: Value started by [ but key was empty")
-				if (key == b'B' or key == b'W') and ("B" in node.props or "W" in node.props):
-					raise ParserFail("Multiple moves in node")
-				continue
-			elif c == 40:								# (
-				if not node:
-					raise ParserFail("SGF load error: New subtree started but node was None")
-				chars_to_skip = _load_sgf_recursive(buf, i, node).readcount
-				i += chars_to_skip - 1	# Subtract 1: the ( character we have read is also counted by the recurse.
-				continue
-			elif c == 41:								# )
-				if not root:
-					raise ParserFail("SGF load error: Subtree ended but local root was None")
-				return ParseResult(root = root, readcount = i + 1 - off)
-			elif c == 59:								# ;
-				if not node:
-					node = Node(parent_of_local_root)
-					root = node
-				else:
-					node = Node(node)
-				key = bytearray()
-				keycomplete = False
-				continue
-			elif c >= 65 and c <= 90:					# A-Z
-				if keycomplete:
-					key = bytearray()
-					keycomplete = False
-				key.append(c)
-				continue
-			else:
-				raise ParserFail("SGF load error: Unacceptable byte while expecting key")
 
-	raise ParserFail("SGF load error: Reached end of input")
+def replay_games(games):
+
+	# Yields replay_moves(width, height, setup, moves) for each tuple of those in games.
+
+	for width, height, setup, moves in games:
+		yield replay_moves(width, height, setup, moves)
+
+
+def replay_packed(tree):
+
+	# Yields (board, captures) for the main line of each game in a PackedTree, taking the moves from
+	# its move arrays, so that no Nodes are made and no move values decoded. Here captures[i] is for
+	# node i along the main line, the root being 0. Setup properties (and PL) are applied wherever
+	# they occur, as Node.apply() would.
+
+	setup_codes = set(i for i, key in enumerate(tree.keys) if key in ("AB", "AW", "AE", "PL"))
+	first_child = tree.first_child
+	colours = tree.colour
+	moves = tree.move
+	prop_start = tree.prop_start
+	prop_count = tree.prop_count
+	prop_key = tree.prop_key
+
+	for root in tree.roots:
+
+		width, height = _sz_dimensions(tree.get(root, "SZ"))
+		board = Board(width, height)
+		points = _replay_points(width, height)
+		captures = []
+		i = root
+
+		while i != -1:
+
+			before = board.caps_by_b + board.caps_by_w
+
+			start = prop_start[i]
+			if setup_codes and any(prop_key[j] in setup_codes for j in range(start, start + prop_count[i])):
+				ab = tree.all_values(i, "AB")
+				aw = tree.all_values(i, "AW")
+				_apply_setup(board, tree.all_values(i, "AE"), ab, aw)
+				if colours[i]:
+					board._play(points[moves[i]], "b" if colours[i] == 1 else "w")
+				elif i == root and ab and not aw:
+					board.active = "w"
+				_apply_pl(board, tree.get(i, "PL"))
+			elif colours[i]:
+				board._play(points[moves[i]], "b" if colours[i] == 1 else "w")
+
+			captures.append(board.caps_by_b + board.caps_by_w - before)
+			i = first_child[i]
+
+		yield board, captures
+
+
+def _setup_values(v):
+	if v is None:
+		return []
+	return [v] if type(v) is str else v
+
+
+_replay_point_tables = dict()
+
+def _replay_points(width, height):
+
+	# Packed move code (x + y * 52, or -1) --> board point, or None for anything not on the board.
+
+	ret = _replay_point_tables.get((width, height))
+	if not ret:
+		geo = _geometry(width, height)
+		ret = [None] * (52 * 52 + 1)						# The last is for -1
+		for s, p in geo.s_to_p.items():
+			x, y = s_to_xy(s)
+			ret[x + y * 52] = p
+		_replay_point_tables[(width, height)] = ret
+	return ret
 
 
 def load_ngf(buf):
@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+
+# Cross-checks for gofish2. Run with:  python -m unittest test_gofish2
+
+import bz2, gc, gzip, io, os, random, tarfile, tempfile, unittest, zipfile
+
+import gofish2
+
+# -------------------------------------------------------------------------------------------------
+# The original recursive, byte-at-a-time SGF parser, kept here as the reference that load_sgf()
+# must agree with: the same trees, or the same ParserFail message.
+
+class _RefNode:
+
+	def __init__(self, parent):
+		self.props = dict()
+		self.children = []
+		if parent:
+			parent.children.append(self)
+
+
+def _ref_load_sgf(buf):
+
+	if type(buf) is str:
+		buf = bytearray(buf.encode(encoding="utf-8", errors="replace"))
+
+	ret = []
+	off = 0
+
+	while len(buf) - off >= 3:
+		try:
+			root, readcount = _ref_load_sgf_recursive(buf, off, None)
+			ret.append(root)
+			off += readcount
+		except:
+			if len(ret) > 0:
+				break
+			else:
+				raise
+
+	if len(ret) == 0:
+		raise gofish2.ParserFail("SGF load error: Found no game")
+
+	return ret
+
+
+def _ref_load_sgf_recursive(buf, off, parent_of_local_root):
+
+	root = None
+	node = None
+	tree_started = False
+	inside_value = False
+	escape_flag = False
+
+	value = bytearray()
+	key = bytearray()
+	keycomplete = False
+
+	i = off - 1
+	while i + 1 < len(buf):
+
+		i += 1
+		c = buf[i]
+
+		if not tree_started:
+			if c <= 32:
+				continue
+			elif c == 40:								# (
+				tree_started = True
+				continue
+			else:
+				raise gofish2.ParserFail("SGF load error: Unexpected byte before (")
+
+		if inside_value:
+
+			if escape_flag:
+				value.append(buf[i])
+				escape_flag = False
+				continue
+			elif c == 92:								# \
+				escape_flag = True
+				continue
+			elif c == 93:								# ]
+				inside_value = False
+				if not node:
+					raise gofish2.ParserFail("SGF load error: Value ended by ] but node was None")
+				node.props.setdefault(key.decode(encoding="utf-8", errors="replace"), []).append(value.decode(encoding="utf-8", errors="replace"))
+				continue
+			else:
+				value.append(c)
+				continue
+
+		else:
+
+			if c <= 32:									# whitespace
+				continue
+			elif c >= 97 and c <= 122:					# a-z
+				if keycomplete:
+					key = bytearray()
+					keycomplete = False
+				continue
+			elif c == 91:								# [
+				if not node:
+					node = _RefNode(parent_of_local_root)
+					root = node
+				value = bytearray()
+				inside_value = True
+				keycomplete = True
+				if len(key) == 0:
+					raise gofish2.ParserFail("SGF load error: Value started by [ but key was empty")
+				if (key == b'B' or key == b'W') and ("B" in node.props or "W" in node.props):
+					raise gofish2.ParserFail("Multiple moves in node")
+				continue
+			elif c == 40:								# (
+				if not node:
+					raise gofish2.ParserFail("SGF load error: New subtree started but node was None")
+				chars_to_skip = _ref_load_sgf_recursive(buf, i, node)[1]
+				i += chars_to_skip - 1
+				continue
+			elif c == 41:								# )
+				if not root:
+					raise gofish2.ParserFail("SGF load error: Subtree ended but local root was None")
+				return root, i + 1 - off
+			elif c == 59:								# ;
+				if not node:
+					node = _RefNode(parent_of_local_root)
+					root = node
+				else:
+					node = _RefNode(node)
+				key = bytearray()
+				keycomplete = False
+				continue
+			elif c >= 65 and c <= 90:					# A-Z
+				if keycomplete:
+					key = bytearray()
+					keycomplete = False
+				key.append(c)
+				continue
+			else:
+				raise gofish2.ParserFail("SGF load error: Unacceptable byte while expecting key")
+
+	raise gofish2.ParserFail("SGF load error: Reached end of input")
+
+# -------------------------------------------------------------------------------------------------
+
+def _flatten(root, values):
+
+	# A tree as a flat list of (depth, props, number of children) in preorder, with props as a
+	# tuple of (key, tuple of values) in insertion order. values(node, key) gives a node's values.
+
+	ret = []
+	stack = [(root, 0)]
+
+	while stack:
+		node, depth = stack.pop()
+		ret.append((depth, tuple((key, tuple(values(node, key))) for key in node.props), len(node.children)))
+		stack.extend((child, depth + 1) for child in reversed(node.children))
+
+	return ret
+
+
+def _outcome(load, buf, values):
+	try:
+		return [_flatten(root, values) for root in load(buf)]
+	except gofish2.ParserFail as e:
+		return str(e)
+
+
+def _ref_outcome(buf):
+	return _outcome(_ref_load_sgf, buf, lambda node, key: node.props[key])
+
+
+def _new_outcome(buf, **kwargs):
+	return _outcome(lambda b: gofish2.load_sgf(b, **kwargs), buf, lambda node, key: node.all_values(key))
+
+
+_samples = [
+	b"(;GM[1]FF[4]SZ[19];B[pd];W[dp];B[pp];W[dd];B[fc];W[cf])",
+	b"(;B[aa];W[bb](;B[cc])(;B[dd];W[ee]))",
+	b"(;FF[4]C[a\\]b\\\\]AB[aa][bb]AddWhite[cc]  (;B[aa])) (;W[bb])",
+	b"  (;GM[1]\n;B[aa]W[bb])",
+	b"(;C[\xe4\xb8\xad\xe6\x96\x87\\\n]PB[x] ;  B [ab] C[multi\nline]\t;W[]TR[aa][bb]\n[cc])",
+	b"(;AB[dd:ff]LB[aa:label\\]]C[" + b"long comment " * 8 + b"];B[tt];W[tt])",
+]
+
+_mutation_bytes = b"();[]\\ \n\tABWCabcxyz01\x00\xff"
+
+
+def _mutations(seed, count):
+
+	# Random edits to pairs of the samples, so every error path and odd corner gets compared too.
+
+	rng = random.Random(seed)
+
+	for n in range(count):
+		buf = bytearray(rng.choice(_samples) + rng.choice(_samples))
+		for k in range(rng.randint(0, 4)):
+			op = rng.random()
+			pos = rng.randrange(len(buf) + 1)
+			if op < 0.4 and len(buf) > 0:
+				del buf[min(pos, len(buf) - 1)]
+			elif op < 0.8:
+				buf.insert(pos, rng.choice(_mutation_bytes))
+			else:
+				del buf[pos:]
+		yield bytes(buf)
+
+# -------------------------------------------------------------------------------------------------
+
+class TestParserMatchesRecursiveParser(unittest.TestCase):
+
+	def test_samples(self):
+		for buf in _samples:
+			expected = _ref_outcome(buf)
+			self.assertEqual(_new_outcome(buf), expected, buf)
+			self.assertEqual(_new_outcome(buf, lazy = True), expected, buf)
+			self.assertEqual(_new_outcome(buf.decode("utf-8", errors = "replace")), _ref_outcome(buf.decode("utf-8", errors = "replace")), buf)
+
+
+	def test_long_node_runs(self):
+
+		# Long mainlines go through the fast path (_sgf_node_run and _sgf_node_run_items).
+
+		rng = random.Random(7)
+		moves = b"".join(b";%s[%s%s]" % (b"BW"[i % 2:i % 2 + 1], bytes([97 + rng.randrange(19)]), bytes([97 + rng.randrange(19)])) for i in range(500))
+		buf = b"(;GM[1]SZ[19]" + moves + b"(;B[aa]C[x\\]y])(;W[bb]" + moves[:200] + b"))"
+		self.assertEqual(_new_outcome(buf), _ref_outcome(buf))
+
+
+	def test_mutations(self):
+		for buf in _mutations(0, 5000):
+			expected = _ref_outcome(buf)
+			self.assertEqual(_new_outcome(buf), expected, buf)
+			self.assertEqual(_new_outcome(buf, lazy = True), expected, buf)
+
+
+class TestPackedParserMatchesParser(unittest.TestCase):
+
+	# load_sgf_packed() shares its driver with load_sgf() but builds the tree itself, so check that
+	# it ends up with the same games, or fails the same way.
+
+	def check(self, buf):
+		packed = _outcome(lambda b: gofish2.load_sgf_packed(b).to_nodes(), buf, lambda node, key: node.all_values(key))
+		self.assertEqual(packed, _new_outcome(buf), buf)
+
+
+	def test_samples(self):
+		for buf in _samples:
+			self.check(buf)
+
+
+	def test_mutations(self):
+		for buf in _mutations(1, 3000):
+			self.check(buf)
+
+
+class TestFeedParserMatchesParser(unittest.TestCase):
+
+	# iter_sgf() (and so SGFFeedParser) must give what load_sgf() gives for the whole input, no
+	# matter how it's chunked; in particular, the same error when there's no game at all.
+
+	def check(self, buf):
+		expected = _new_outcome(buf)
+		for chunk_size in (1, 2, 3, 7):
+			fed = _outcome(lambda b: list(gofish2.iter_sgf(io.BytesIO(b), chunk_size = chunk_size)), buf, lambda node, key: node.all_values(key))
+			self.assertEqual(fed, expected, (buf, chunk_size))
+
+
+	def test_short_inputs(self):
+		for buf in [b"", b" ", b";", b";B", b";B[aa])", b"  ;", b"(", b"()", b"() ", b"(;", b"(;B[aa]) ;x", b"(;B[aa])()", b"(;B[aa]) ("]:
+			self.check(buf)
+
+
+	def test_mutations(self):
+		for buf in _mutations(2, 2000):
+			self.check(buf)
+
+
+class TestLazyLoad(unittest.TestCase):
+
+	# Lazily loaded trees may hold their file open (through a map); loading many files must not
+	# run out of file descriptors.
+
+	@unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc/self/fd")
+	def test_fds_bounded(self):
+
+		samples = [buf for buf in _samples if type(_new_outcome(buf)) is list]		# Those that load
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			for n in range(300):
+				with open(os.path.join(tmpdir, "{}.sgf".format(n)), "wb") as outfile:
+					outfile.write(samples[n % len(samples)])
+
+			before = len(os.listdir("/proc/self/fd"))
+			trees = [gofish2.load(os.path.join(tmpdir, "{}.sgf".format(n)), lazy = True) for n in range(300)]
+			self.assertLess(len(os.listdir("/proc/self/fd")) - before, 10)
+
+			for n, roots in enumerate(trees):
+				self.assertEqual(_outcome(lambda b: roots, None, lambda node, key: node.all_values(key)), _new_outcome(samples[n % len(samples)]))
+
+class TestPositionIndex(unittest.TestCase):
+
+	# Boards of different sizes must never match each other, even where their stones sit on the
+	# same points (and so have the same Zobrist keys).
+
+	games = [
+		b"(;SZ[9];B[cc];W[gg])",							# 0
+		b"(;SZ[9];B[gc])",									# 1  Same as 0 after the first move, up to symmetry
+		b"(;SZ[13];B[cc])",									# 2
+		b"(;SZ[19];B[cc];W[pp])",							# 3
+		b"(;SZ[19];B[qc])",									# 4  Same as 3 after the first move, up to symmetry
+	]
+
+	def find(self, index, width, height, *moves):
+		board = gofish2.Board(width, height)
+		for colour, s in zip("bw" * len(moves), moves):
+			board.play_move_or_pass(s, colour)
+		return index.find_position(board)
+
+
+	def build(self, tmpdir, symmetries):
+		filename = os.path.join(tmpdir, "positions.idx")
+		gofish2.save_position_index(filename, [gofish2.load_sgf(buf)[0] for buf in self.games], symmetries)
+		return filename
+
+
+	def test_mixed_sizes(self):
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+
+			with gofish2.load_position_index(self.build(tmpdir, False)) as index:
+				self.assertFalse(index.symmetries)
+				self.assertEqual(self.find(index, 19, 19), [(3, 0), (4, 0)])
+				self.assertEqual(self.find(index, 9, 9), [(0, 0), (1, 0)])
+				self.assertEqual(self.find(index, 19, 19, "cc"), [(3, 1)])
+				self.assertEqual(self.find(index, 13, 13, "cc"), [(2, 1)])
+				self.assertEqual(self.find(index, 9, 9, "cc"), [(0, 1)])
+				self.assertEqual(self.find(index, 9, 9, "cc", "gg"), [(0, 2)])
+				self.assertEqual(self.find(index, 9, 13, "cc"), [])
+
+			with gofish2.load_position_index(self.build(tmpdir, True)) as index:
+				self.assertTrue(index.symmetries)
+				self.assertEqual(self.find(index, 19, 19), [(3, 0), (4, 0)])
+				self.assertEqual(self.find(index, 19, 19, "cc"), [(3, 1), (4, 1)])
+				self.assertEqual(self.find(index, 19, 19, "cq"), [(3, 1), (4, 1)])
+				self.assertEqual(self.find(index, 13, 13, "kk"), [(2, 1)])
+				self.assertEqual(self.find(index, 9, 9, "cc"), [(0, 1), (1, 1)])
+				self.assertEqual(self.find(index, 9, 9, "gg", "cc"), [(0, 2)])
+
+
+	def test_old_version_refused(self):
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			filename = self.build(tmpdir, False)
+			with open(filename, "r+b") as f:
+				header = gofish2._posindex_header.unpack(f.read(gofish2._posindex_header.size))
+				f.seek(0)
+				f.write(gofish2._posindex_header.pack(header[0], 1, header[2], header[3]))
+			with self.assertRaises(gofish2.ParserFail):
+				gofish2.load_position_index(filename)
+
+def _stones(board, colour):
+	return sum(list(column).count(colour) for column in board.state)
+
+
+class TestTrackedLegalMoves(unittest.TestCase):
+
+	def test_playouts(self):
+
+		# Random playouts, checking after every move that a tracking board's legal moves (for both
+		# colours, with and without superko) are those of a board that works them out from scratch.
+		# Some moves are random points, so suicides are played too. The counts make sure captures,
+		# kos and suicides all actually happened.
+
+		rng = random.Random(5)
+		captures = kos = suicides = 0
+
+		for trial in range(20):
+			size = rng.choice([4, 5, 7, 9])
+			tracked = gofish2.Board(size, size)
+			tracked.track_legal_moves()
+			plain = gofish2.Board(size, size)
+			history = {tracked.position_hash()}
+			colour = "b"
+
+			for step in range(300):
+				moves = tracked.legal_moves(colour)
+				if moves and rng.random() < 0.9:
+					s = tracked.point_to_s(rng.choice(moves))
+				else:
+					x, y = rng.randrange(size), rng.randrange(size)
+					if tracked.state[x][y]:
+						continue
+					s = gofish2.xy_to_s(x, y)
+
+				own = _stones(tracked, colour)
+				other = _stones(tracked, "w" if colour == "b" else "b")
+				tracked.play_move_or_pass(s, colour)
+				plain.play_move_or_pass(s, colour)
+				history.add(tracked.position_hash())
+				colour = "w" if colour == "b" else "b"
+
+				captures += _stones(tracked, colour) < other
+				suicides += _stones(tracked, "w" if colour == "b" else "b") <= own
+				kos += tracked.ko != None
+
+				for c in ("b", "w"):
+					self.assertEqual(tracked.legal_moves(c), plain.legal_moves(c), (trial, step, c))
+					self.assertEqual(tracked.legal_moves(c, history), plain.legal_moves(c, history), (trial, step, c))
+
+		self.assertGreater(captures, 50)
+		self.assertGreater(kos, 10)
+		self.assertGreater(suicides, 10)
+
+class TestPackedRoundTrip(unittest.TestCase):
+
+	# Games saved with save_packed() must come back exactly as parsed, as far as dumps() can tell.
+
+	games = [
+		b"(;GM[1]FF[4]SZ[19]AB[aa][bb][cc]AW[dd]PL[W];W[ee];B[];W[tt];B[ss])",
+		b"(;SZ[9]AB[aa:ic]AW[ad:ie][af]AE[bb];B[ee];W[gg](;B[]C[pass])(;B[hh];W[]))",
+		b"(;SZ[7:13]AB[ga][am];B[gm];W[ag];B[hh];W[ab];B[tt])",
+		b"(;SZ[13:7]AB[ma][ag];B[mg];W[ga])",
+		b"(;SZ[21];B[tt];W[uu];B[aa])",
+		b"(;SZ[52]AB[ZZ][aZ][Za][aa:ee];B[ZZ];W[Ya];B[];W[aZ]AE[ZZ])",
+		b"(;SZ[19]TR[aa][bb][cc]LB[dd:one][ee:two\\]MA[ff]SQ[gg:hh]XX[1][2][3];B[dd]C[a \\] b\\\\ c]TR[dd][ee])",
+		b"(;SZ[19]AB[];W[pd]AW[];B[dp]N[]C[])",
+		b"(;;;B[aa];;W[bb])",
+	]
+
+	# Setup stones listed in x + y * width order, enough of them to be saved as bitsets.
+
+	games.append(b"(;SZ[9]AB" + b"".join(b"[%c%c]" % (97 + x, 97 + y) for y in range(3) for x in range(9)) + b";B[ee])")
+	games.append(b"(;SZ[19:5]AW" + b"".join(b"[%c%c]" % (97 + x, 97 + y) for y in range(5) for x in range(0, 19, 2)) + b"AE[aa][ca];W[tt])")
+
+	def random_game(self, rng):
+		width, height = rng.choice([(9, 9), (19, 19), (7, 13), (52, 52), (25, 3)])
+		letters = gofish2._sgf_letters
+		point = lambda: letters[rng.randrange(width)] + letters[rng.randrange(height)]
+		out = ["(;SZ[{}:{}]".format(width, height)]
+		if rng.random() < 0.5:
+			stones = [point() for n in range(rng.randrange(1, 60))]
+			if rng.random() < 0.5:
+				stones = sorted(set(stones), key = lambda s: s[::-1])			# Row by row, as bitsets need
+			out.append("AB" + "".join("[{}]".format(s) for s in stones))
+		for i in range(rng.randrange(50)):
+			out.append(";{}[{}]".format("BW"[i % 2], point() if rng.random() < 0.9 else ""))
+			if rng.random() < 0.1:
+				out.append("TR[{}][{}]C[{}]".format(point(), point(), i))
+			if rng.random() < 0.05:
+				out.append("AW[{}]AE[{}]".format(point(), point()))
+		out.append(")")
+		return "".join(out).encode()
+
+
+	def check(self, bufs):
+		roots = [gofish2.load_sgf(buf)[0] for buf in bufs]
+		with tempfile.TemporaryDirectory() as tmpdir:
+			filename = os.path.join(tmpdir, "games.gf2p")
+			gofish2.save_packed(filename, roots)
+			with gofish2.load_packed(filename) as games:
+				self.assertEqual(len(games), len(roots))
+				for i, root in enumerate(roots):
+					self.assertEqual(gofish2.dumps(games[i]), gofish2.dumps(root), bufs[i])
+				self.assertEqual([gofish2.dumps(game) for game in games[:]], [gofish2.dumps(root) for root in roots])
+
+
+	def test_samples(self):
+		self.check(self.games)
+
+
+	def test_random(self):
+		rng = random.Random(9)
+		self.check([self.random_game(rng) for n in range(200)])
+
+class TestArchives(unittest.TestCase):
+
+	# Members compressed by themselves (e.g. "x.sgf.gz") inside zip and tar archives must load the
+	# same as the plain members they were made from.
+
+	members = [
+		("a.sgf", _samples[0]),
+		("b.sgf.gz", gzip.compress(_samples[1])),
+		("dir/c.sgf.bz2", bz2.compress(_samples[2])),
+		("notes.txt", b"not a game"),
+		("d.SGF.GZ", gzip.compress(_samples[5])),
+	]
+
+	def expected(self):
+		return sum((_new_outcome(buf) for buf in (_samples[0], _samples[1], _samples[2], _samples[5])), [])
+
+
+	def zip_bytes(self):
+		out = io.BytesIO()
+		with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+			for name, data in self.members:
+				archive.writestr(name, data)
+		return out.getvalue()
+
+
+	def tar_bytes(self, mode):
+		out = io.BytesIO()
+		with tarfile.open(fileobj = out, mode = mode) as archive:
+			for name, data in self.members:
+				info = tarfile.TarInfo(name)
+				info.size = len(data)
+				archive.addfile(info, io.BytesIO(data))
+		return out.getvalue()
+
+
+	def check(self, filename, data):
+		with tempfile.TemporaryDirectory() as tmpdir:
+			path = os.path.join(tmpdir, filename)
+			with open(path, "wb") as outfile:
+				outfile.write(data)
+			roots = gofish2.load(path)
+		self.assertEqual([_flatten(root, lambda node, key: node.all_values(key)) for root in roots], self.expected())
+
+
+	def test_zip(self):
+		self.check("games.zip", self.zip_bytes())
+
+
+	def test_tar_xz(self):
+		self.check("games.tar.xz", self.tar_bytes("w:xz"))
+
+
+	def test_tar(self):
+		self.check("games.tar", self.tar_bytes("w"))
+
+class TestBoardCaching(unittest.TestCase):
+
+	# Whatever Node.checkpoint_interval and Node.board_cache are set to, make_board() must give the
+	# board that replaying from the root gives, however the nodes are visited and edited.
+
+	def setUp(self):
+		interval, cache = gofish2.Node.checkpoint_interval, gofish2.Node.board_cache
+		def restore():
+			gofish2.Node.checkpoint_interval, gofish2.Node.board_cache = interval, cache
+		self.addCleanup(restore)
+
+
+	def random_tree(self, rng):
+
+		# Small boards, so that there are plenty of captures, with setup stones here and there.
+
+		size = rng.choice([5, 7, 9])
+		letters = gofish2._sgf_letters
+		point = lambda: letters[rng.randrange(size)] + letters[rng.randrange(size)]
+
+		root = gofish2.Node()
+		root.set("SZ", size)
+		nodes = [root]
+		for n in range(150):
+			parent = nodes[-1] if rng.random() < 0.9 else rng.choice(nodes)
+			node = gofish2.Node(parent)
+			if rng.random() < 0.05:
+				node.set(rng.choice(["AB", "AW", "AE"]), point())
+			else:
+				node.set(rng.choice("BW"), point() if rng.random() < 0.95 else "")
+			nodes.append(node)
+		return nodes
+
+
+	def replayed(self, node):
+		board = gofish2.Board(node.width, node.height)
+		for n in node.history():
+			n.apply(board)
+		return board
+
+
+	def walk(self, rng, nodes):
+		for step in range(200):
+			node = rng.choice(nodes)
+			if rng.random() < 0.02:
+				node.set(rng.choice("BW"), gofish2.xy_to_s(rng.randrange(node.width), rng.randrange(node.height)))
+			self.assertTrue(node.make_board() == self.replayed(node))
+
+
+	def test_modes(self):
+
+		rng = random.Random(11)
+
+		for interval in (0, 1, 4, 25):
+			for max_boards in (None, 0, 1, 6, 1000):
+				gofish2.Node.checkpoint_interval = interval
+				gofish2.Node.board_cache = cache = None if max_boards is None else gofish2.BoardCache(max_boards)
+				trees = [self.random_tree(rng) for n in range(2)]
+				for nodes in trees:
+					self.walk(rng, nodes)
+				if cache != None:
+					self.assertLessEqual(len(cache), max_boards)
+					if 0 < max_boards < 1000:
+						self.assertGreater(cache.evictions, 0)
+
+				# The cache only holds nodes weakly, so dropping the trees empties it.
+
+				del trees, nodes
+				gc.collect()
+				if cache != None:
+					self.assertEqual(len(cache), 0)
+
+
+class TestPushPop(unittest.TestCase):
+
+	def check_same(self, board, expected):
+		self.assertTrue(board == expected)
+		self.assertEqual(board.legal_moves(), expected.legal_moves())
+		for p in board.points():
+			if board.state_at_point(p):
+				self.assertEqual(sorted(board.chain_of_point(p)), sorted(expected.chain_of_point(p)))
+				self.assertEqual(board.liberties_of_point(p), expected.liberties_of_point(p))
+
+
+	def test_matches_copies(self):
+
+		# Random walks of pushes and pops, against copies played with play_move_or_pass(). Some moves
+		# are random points, so suicides and plays onto stones are covered too.
+
+		rng = random.Random(3)
+
+		for trial in range(30):
+			size = rng.choice([5, 7, 9])
+			board = gofish2.Board(size, size)
+			if trial % 2:
+				board.track_legal_moves()
+			stack = [board.copy()]
+			colour = "b"
+			for step in range(200):
+				if len(stack) > 1 and rng.random() < 0.35:
+					board.pop()
+					stack.pop()
+				else:
+					moves = board.legal_moves()
+					if moves and rng.random() < 0.95:
+						s = board.point_to_s(rng.choice(moves))
+					else:
+						s = gofish2.xy_to_s(rng.randrange(size), rng.randrange(size))
+					expected = stack[-1].copy()
+					expected.play_move_or_pass(s, colour)
+					board.push(s, colour)
+					stack.append(expected)
+				self.check_same(board, stack[-1])
+				colour = "w" if colour == "b" else "b"
+
+
+	def test_other_changes_refused(self):
+
+		board = gofish2.Board(5, 5)
+		board.track_legal_moves()
+		board.play_move_or_pass("ae", "w")
+		board.play_move_or_pass("cc", "w")
+		expected = board.copy()
+
+		board.push("be", "b")
+		with self.assertRaises(RuntimeError):
+			board.play_move_or_pass("ae", "b")
+		with self.assertRaises(RuntimeError):
+			board.set_at("dc", "b")
+		with self.assertRaises(RuntimeError):
+			board.state[3][2] = "b"
+		with self.assertRaises(RuntimeError):
+			board.destroy_group("cc")
+		board.pop()
+
+		self.check_same(board, expected)
+		board.play_move_or_pass("ae", "b")				# Fine again once nothing is pushed
+
+
+class TestBoardState(unittest.TestCase):
+
+	def test_view(self):
+
+		board = gofish2.Board(5, 3)
+		board.set_at("ca", "b")
+		board.state[1][2] = "w"									# Same as set_at("bc", "w")
+
+		self.assertEqual(board.state_at("bc"), "w")
+		self.assertEqual(len(board.state), 5)
+		self.assertEqual(len(board.state[0]), 3)
+		self.assertEqual(board.state[2][0], "b")
+		self.assertEqual(board.state[-1][-1], "")
+		self.assertEqual(board.state[1][1:], ["", "w"])
+		self.assertEqual(board.state, [["", "", ""], ["", "", "w"], ["b", "", ""], ["", "", ""], ["", "", ""]])
+		self.assertEqual(board.state, board.copy().state)
+		self.assertFalse(board.state == None)
+		self.assertFalse(board.state[0] == 5)
+		self.assertTrue(board.state != "bw")
+
+		with self.assertRaises(IndexError):
+			board.state[0][3]
+		with self.assertRaises(ValueError):
+			board.state[0][0] = "x"
+
+
+if __name__ == "__main__":
+	unittest.main()